@@ -6,30 +6,36 @@ Version 3.4 - Simple searchable selectbox for product selection
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import hashlib
+import math
+import io
 from datetime import datetime, date, timedelta
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, NamedTuple, Optional
 
 # Import utilities
 from utils.auth import AuthManager
-from utils.db import get_db_engine
+from utils.db import get_db_engine, read_frame, escape_like
 from utils.safety_stock.crud import (
     get_safety_stock_levels,
+    count_safety_stock_levels,
+    clear_safety_stock_level_caches,
     get_safety_stock_by_id,
     create_safety_stock,
     update_safety_stock,
     delete_safety_stock,
-    create_safety_stock_review,
+    submit_safety_stock_review,
     get_review_history,
     bulk_create_safety_stock
 )
 from utils.safety_stock.calculations import (
     calculate_safety_stock, 
+    clear_historical_demand_cache,
     Z_SCORE_MAP,
 )
 from utils.safety_stock.demand_analysis import (
-    fetch_demand_stats,
-    get_lead_time_estimate,
+    fetch_demand_and_lead_time,
 )
 from utils.safety_stock.validations import (
     validate_safety_stock_data,
@@ -39,14 +45,15 @@ from utils.safety_stock.validations import (
 from utils.safety_stock.export import (
     export_to_excel,
     create_upload_template,
-    generate_review_report
+    generate_review_report,
+    read_upload_file
 )
 from utils.safety_stock.permissions import (
     get_user_role,
     has_permission,
-    filter_data_for_customer,
     get_permission_message,
     get_user_info_display,
+    get_restricted_customer_id,
     apply_export_limit,
     log_action
 )
@@ -79,94 +86,130 @@ if 'ss_filters' not in st.session_state:
         'customer_id': None,
         'product_id': None,
         'product_search': '',
-        'status': 'active'
+        'status': 'active',
+        'page': 0
     }
 
 # Dialog state management - FIX for dialog closing bug
 if 'dialog_data' not in st.session_state:
     st.session_state.dialog_data = {}
 
+# ==================== Constants ====================
+
+CALCULATION_METHODS = ['FIXED', 'DAYS_OF_SUPPLY', 'LEAD_TIME_BASED']
+_METHOD_IDX = {method: i for i, method in enumerate(CALCULATION_METHODS)}
+
+_SERVICE_LEVEL_OPTIONS = list(Z_SCORE_MAP.keys())
+_SERVICE_LEVEL_INDEX = {sl: i for i, sl in enumerate(_SERVICE_LEVEL_OPTIONS)}
+
+PAGE_SIZE = 100
+
+# Columns shown in the main table (id/customer_id are always fetched as well)
+TABLE_COLUMNS = (
+    'pt_code', 'product_name', 'entity_code', 'customer_code',
+    'safety_stock_qty', 'reorder_point',
+    'calculation_method', 'rule_type',
+    'status', 'effective_from', 'priority_level'
+)
+
+# Low-cardinality table columns sent to the browser as categoricals (smaller Arrow payload)
+TABLE_CATEGORY_COLUMNS = {
+    col: 'category'
+    for col in ('entity_code', 'customer_code', 'calculation_method', 'rule_type', 'status')
+}
+
+REVIEW_ACTIONS = ['NO_CHANGE', 'INCREASED', 'DECREASED', 'METHOD_CHANGED']
+_ACTION_IDX = {action: i for i, action in enumerate(REVIEW_ACTIONS)}
+
 # ==================== Data Loading Functions ====================
 
-@st.cache_data(ttl=300)
+# Statements are built once at import and reused on every cache refresh.
+# Filter options: one round trip for all three sets, tagged by kind and split below
+_FILTER_OPTIONS_QUERY = text("""
+SELECT DISTINCT 
+    'entity' as kind,
+    e.id,
+    e.company_code,
+    e.english_name,
+    NULL as pt_code,
+    NULL as name,
+    NULL as package_size,
+    NULL as brand_name,
+    e.company_code as sort_key
+FROM safety_stock_levels s
+JOIN companies e ON s.entity_id = e.id
+WHERE s.delete_flag = 0 AND s.is_active = 1
+
+UNION ALL
+
+SELECT DISTINCT 
+    'customer' as kind,
+    c.id,
+    c.company_code,
+    c.english_name,
+    NULL, NULL, NULL, NULL,
+    c.company_code
+FROM safety_stock_levels s
+LEFT JOIN companies c ON s.customer_id = c.id
+WHERE s.delete_flag = 0 AND s.is_active = 1
+AND s.customer_id IS NOT NULL
+
+UNION ALL
+
+SELECT DISTINCT 
+    'product' as kind,
+    p.id,
+    NULL, NULL,
+    p.pt_code,
+    p.name,
+    p.package_size,
+    b.brand_name,
+    p.pt_code
+FROM safety_stock_levels s
+JOIN products p ON s.product_id = p.id
+LEFT JOIN brands b ON p.brand_id = b.id
+WHERE s.delete_flag = 0 AND s.is_active = 1
+
+ORDER BY kind, sort_key
+""")
+
+@st.cache_resource(ttl=300, show_spinner=False)
 def load_existing_filter_options():
-    """Load filter options only from existing safety stock data"""
+    """Load filter options only from existing safety stock data
+    
+    Cached as a shared resource (no per-rerun copy); callers must treat the lists as read-only.
+    """
     try:
         engine = get_db_engine()
-        
-        entity_query = text("""
-        SELECT DISTINCT 
-            e.id,
-            e.company_code,
-            e.english_name
-        FROM safety_stock_levels s
-        JOIN companies e ON s.entity_id = e.id
-        WHERE s.delete_flag = 0 AND s.is_active = 1
-        ORDER BY e.company_code
-        """)
-        
-        customer_query = text("""
-        SELECT DISTINCT 
-            c.id,
-            c.company_code,
-            c.english_name
-        FROM safety_stock_levels s
-        LEFT JOIN companies c ON s.customer_id = c.id
-        WHERE s.delete_flag = 0 AND s.is_active = 1
-        AND s.customer_id IS NOT NULL
-        ORDER BY c.company_code
-        """)
-        
-        product_query = text("""
-        SELECT DISTINCT 
-            p.id,
-            p.pt_code,
-            p.name,
-            p.package_size,
-            b.brand_name
-        FROM safety_stock_levels s
-        JOIN products p ON s.product_id = p.id
-        LEFT JOIN brands b ON p.brand_id = b.id
-        WHERE s.delete_flag = 0 AND s.is_active = 1
-        ORDER BY p.pt_code
-        """)
-        
         with engine.connect() as conn:
-            entities_df = pd.read_sql(entity_query, conn)
-            customers_df = pd.read_sql(customer_query, conn)
-            products_df = pd.read_sql(product_query, conn)
-        
-        # Format display
-        entities = (entities_df['company_code'] + ' - ' + entities_df['english_name']).tolist()
-        entity_ids = entities_df['id'].tolist()
+            rows = conn.execute(_FILTER_OPTIONS_QUERY).mappings().all()
         
+        # Entities/customers only need label and id lists - no DataFrame round trip
+        entities = []
+        entity_ids = []
         customers = []
         customer_ids = []
-        if not customers_df.empty:
-            customers = (customers_df['company_code'] + ' - ' + customers_df['english_name']).tolist()
-            customer_ids = customers_df['id'].tolist()
+        product_rows = []
+        for row in rows:
+            kind = row['kind']
+            if kind == 'entity':
+                entities.append(f"{row['company_code']} - {row['english_name'] or ''}")
+                entity_ids.append(row['id'])
+            elif kind == 'customer':
+                customers.append(f"{row['company_code']} - {row['english_name'] or ''}")
+                customer_ids.append(row['id'])
+            else:
+                product_rows.append(row)
         
         products = []
         product_ids = []
-        if not products_df.empty:
-            for _, row in products_df.iterrows():
-                pt_code = str(row['pt_code'])
-                name = str(row['name']) if pd.notna(row['name']) else ""
-                name = name[:35] + "..." if len(name) > 35 else name
-                pkg = str(row['package_size']) if pd.notna(row['package_size']) else ""
-                pkg = pkg[:20] + "..." if len(pkg) > 20 else pkg
-                brand = str(row['brand_name']) if pd.notna(row['brand_name']) else ""
-                
-                display = f"{pt_code} | {name}"
-                if pkg and brand:
-                    display += f" | {pkg} ({brand})"
-                elif pkg:
-                    display += f" | {pkg}"
-                elif brand:
-                    display += f" ({brand})"
-                
-                products.append(display)
-                product_ids.append(row['id'])
+        if product_rows:
+            products_df = pd.DataFrame(
+                product_rows,
+                columns=['id', 'pt_code', 'name', 'package_size', 'brand_name']
+            )
+            products = format_product_labels(products_df).tolist()
+            product_ids = products_df['id'].tolist()
         
         return {
             'entities': entities,
@@ -174,7 +217,12 @@ def load_existing_filter_options():
             'customers': customers,
             'customer_ids': customer_ids,
             'products': products,
-            'product_ids': product_ids
+            'product_ids': product_ids,
+            # label -> id (and id -> label for customers) so filters resolve without .index() scans
+            'entity_map': dict(zip(entities, entity_ids)),
+            'customer_map': dict(zip(customers, customer_ids)),
+            'customer_names': dict(zip(customer_ids, customers)),
+            'product_map': dict(zip(products, product_ids))
         }
         
     except Exception as e:
@@ -185,63 +233,99 @@ def load_existing_filter_options():
             'customers': [],
             'customer_ids': [],
             'products': [],
-            'product_ids': []
+            'product_ids': [],
+            'entity_map': {},
+            'customer_map': {},
+            'customer_names': {},
+            'product_map': {}
         }
 
-@st.cache_data(ttl=300)
-def load_entities():
+class CompanyLookup(NamedTuple):
+    """Selectbox labels for a company list, with id <-> label maps"""
+    display_texts: List[str]
+    ids: List[int]
+    index_by_id: Dict[int, int]
+    id_by_text: Dict[str, int]
+
+def _build_company_lookup(df: pd.DataFrame) -> CompanyLookup:
+    """Precompute selectbox labels and id maps once so reruns don't rebuild them"""
+    display_texts = (df['company_code'].astype(str) + ' - ' + df['english_name'].fillna('').astype(str)).tolist()
+    ids = df['id'].tolist()
+    return CompanyLookup(
+        display_texts=display_texts,
+        ids=ids,
+        index_by_id=dict(zip(ids, range(len(ids)))),
+        id_by_text=dict(zip(display_texts, ids))
+    )
+
+_EMPTY_COMPANY_LOOKUP = CompanyLookup([], [], {}, {})
+
+_ENTITY_QUERY = text("""
+SELECT DISTINCT 
+    c.id, 
+    c.company_code, 
+    c.english_name,
+    COUNT(DISTINCT w.id) as warehouse_count
+FROM companies c
+INNER JOIN companies_company_types cct ON c.id = cct.companies_id
+INNER JOIN company_types ct ON cct.company_type_id = ct.id
+LEFT JOIN warehouses w ON c.id = w.company_id AND w.delete_flag = 0
+WHERE ct.name = 'Internal'
+AND c.delete_flag = 0
+AND c.company_code IS NOT NULL
+GROUP BY c.id, c.company_code, c.english_name
+ORDER BY c.company_code
+""")
+
+_CUSTOMER_QUERY = text("""
+SELECT DISTINCT 
+    c.id, 
+    c.company_code, 
+    c.english_name 
+FROM companies c
+INNER JOIN companies_company_types cct ON c.id = cct.companies_id
+INNER JOIN company_types ct ON cct.company_type_id = ct.id
+WHERE ct.name = 'Customer'
+AND c.delete_flag = 0
+AND c.company_code IS NOT NULL
+ORDER BY c.company_code
+""")
+
+@st.cache_resource(ttl=3600)
+def _load_reference_data():
+    """Load entity and customer lookups together over a single connection"""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        entities_df = read_frame(conn, _ENTITY_QUERY, dtype_backend='pyarrow')
+        customers_df = read_frame(conn, _CUSTOMER_QUERY, dtype_backend='pyarrow')
+    
+    return {
+        'entities': _build_company_lookup(entities_df),
+        'customers': _build_company_lookup(customers_df)
+    }
+
+def load_entities() -> CompanyLookup:
     """Load Internal companies (entities)"""
     try:
-        engine = get_db_engine()
-        query = text("""
-        SELECT DISTINCT 
-            c.id, 
-            c.company_code, 
-            c.english_name,
-            COUNT(DISTINCT w.id) as warehouse_count
-        FROM companies c
-        INNER JOIN companies_company_types cct ON c.id = cct.companies_id
-        INNER JOIN company_types ct ON cct.company_type_id = ct.id
-        LEFT JOIN warehouses w ON c.id = w.company_id AND w.delete_flag = 0
-        WHERE ct.name = 'Internal'
-        AND c.delete_flag = 0
-        AND c.company_code IS NOT NULL
-        GROUP BY c.id, c.company_code, c.english_name
-        ORDER BY c.company_code
-        """)
-        with engine.connect() as conn:
-            return pd.read_sql(query, conn)
+        return _load_reference_data()['entities']
     except Exception as e:
         st.error(f"Error loading entities: {e}")
-        return pd.DataFrame()
+        return _EMPTY_COMPANY_LOOKUP
 
-@st.cache_data(ttl=300)
-def load_customers():
+def load_customers() -> CompanyLookup:
     """Load customer list"""
     try:
-        engine = get_db_engine()
-        query = text("""
-        SELECT DISTINCT 
-            c.id, 
-            c.company_code, 
-            c.english_name 
-        FROM companies c
-        INNER JOIN companies_company_types cct ON c.id = cct.companies_id
-        INNER JOIN company_types ct ON cct.company_type_id = ct.id
-        WHERE ct.name = 'Customer'
-        AND c.delete_flag = 0
-        AND c.company_code IS NOT NULL
-        ORDER BY c.company_code
-        """)
-        with engine.connect() as conn:
-            return pd.read_sql(query, conn)
+        return _load_reference_data()['customers']
     except Exception as e:
         st.error(f"Error loading customers: {e}")
-        return pd.DataFrame()
+        return _EMPTY_COMPANY_LOOKUP
 
-@st.cache_data(ttl=300)
-def load_all_products_for_select():
-    """Load all products formatted for selectbox"""
+@st.cache_resource(ttl=60, max_entries=256)
+def search_products(search: str, limit: int = 50):
+    """Search products by PT code or name, formatted for selectbox
+    
+    Shared across sessions without copying - the returned list/dict are read-only.
+    """
     try:
         engine = get_db_engine()
         query = text("""
@@ -256,74 +340,96 @@ def load_all_products_for_select():
         LEFT JOIN brands b ON p.brand_id = b.id
         WHERE p.delete_flag = 0
         AND p.pt_code IS NOT NULL
+        AND (p.pt_code LIKE :search OR p.name LIKE :search)
         ORDER BY p.pt_code
+        LIMIT :limit
         """)
         
         with engine.connect() as conn:
-            df = pd.read_sql(query, conn)
+            df = read_frame(
+                conn, query, {'search': f"%{escape_like(search)}%", 'limit': limit},
+                dtype_backend='pyarrow'
+            )
         
         if df.empty:
             return [], {}
         
         # Create display text and mapping
-        options = []
-        id_map = {}
-        
-        for _, row in df.iterrows():
-            display = format_product_display(row)
-            options.append(display)
-            id_map[display] = row['id']
+        options = format_product_labels(df).tolist()
+        id_map = dict(zip(options, df['id'].tolist()))
         
         return options, id_map
         
     except Exception as e:
-        logger.error(f"Error loading products: {e}")
+        logger.error(f"Error searching products: {e}")
         return [], {}
 
-def format_product_display(row):
-    """Format product display"""
-    pt_code = str(row['pt_code'])
-    name = str(row['name']) if pd.notna(row['name']) else ""
-    name = name[:35] + "..." if len(name) > 35 else name
-    pkg = str(row['package_size']) if pd.notna(row['package_size']) else ""
-    pkg = pkg[:20] + "..." if len(pkg) > 20 else pkg
-    brand = str(row['brand_name']) if pd.notna(row['brand_name']) else ""
-    
-    display = f"{pt_code} | {name}"
-    if pkg and brand:
-        display += f" | {pkg} ({brand})"
-    elif pkg:
-        display += f" | {pkg}"
-    elif brand:
-        display += f" ({brand})"
-    
-    return display
+def _truncate_text(values: pd.Series, width: int) -> pd.Series:
+    """Helper to blank out missing values and cut text longer than width with '...'"""
+    text = values.fillna('').astype(str)
+    return text.where(text.str.len() <= width, text.str.slice(0, width) + '...')
 
+def format_product_labels(df: pd.DataFrame) -> pd.Series:
+    """Format product display labels for a whole frame ("PT | name | pkg (brand)")"""
+    name = _truncate_text(df['name'], 35)
+    pkg = _truncate_text(df['package_size'], 20)
+    brand = df['brand_name'].fillna('').astype(str)
+    
+    has_pkg = (pkg != '').to_numpy()
+    has_brand = (brand != '').to_numpy()
+    suffix = np.select(
+        [has_pkg & has_brand, has_pkg, has_brand],
+        [(' | ' + pkg + ' (' + brand + ')').to_numpy(), (' | ' + pkg).to_numpy(), (' (' + brand + ')').to_numpy()],
+        default=''
+    )
+    
+    return df['pt_code'].astype(str) + ' | ' + name + suffix
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_quick_stats():
     """Get dashboard statistics"""
     try:
         engine = get_db_engine()
+        # Independent scalar subqueries - plain COUNT(*) where s.id is unique, and an
+        # index-friendly NOT EXISTS on last_calculated_date instead of COUNT(DISTINCT CASE ...)
         query = text("""
         SELECT 
-            COUNT(DISTINCT s.id) as total_items,
-            COUNT(DISTINCT CASE WHEN s.customer_id IS NOT NULL THEN s.id END) as customer_rules,
-            COUNT(DISTINCT CASE 
-                WHEN ssp.last_calculated_date < DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY) 
-                OR ssp.last_calculated_date IS NULL 
-                THEN s.id END) as needs_review,
-            COUNT(DISTINCT s.product_id) as unique_products
-        FROM safety_stock_levels s
-        LEFT JOIN safety_stock_parameters ssp ON s.id = ssp.safety_stock_level_id
-        WHERE s.delete_flag = 0 AND s.is_active = 1
+            (SELECT COUNT(*)
+             FROM safety_stock_levels s
+             WHERE s.delete_flag = 0 AND s.is_active = 1) as total_items,
+            (SELECT COUNT(*)
+             FROM safety_stock_levels s
+             WHERE s.delete_flag = 0 AND s.is_active = 1
+             AND s.customer_id IS NOT NULL) as customer_rules,
+            (SELECT COUNT(*)
+             FROM safety_stock_levels s
+             WHERE s.delete_flag = 0 AND s.is_active = 1
+             AND NOT EXISTS (
+                 SELECT 1 FROM safety_stock_parameters ssp
+                 WHERE ssp.safety_stock_level_id = s.id
+                 AND ssp.last_calculated_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)
+             )) as needs_review,
+            (SELECT COUNT(DISTINCT s.product_id)
+             FROM safety_stock_levels s
+             WHERE s.delete_flag = 0 AND s.is_active = 1) as unique_products
         """)
         with engine.connect() as conn:
-            return conn.execute(query).fetchone()
+            row = conn.execute(query).fetchone()
+        return dict(row._mapping) if row else None
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return None
 
 def safe_int(value, default=0):
     """Safely convert to Python int"""
+    # Fast paths for plain Python scalars (the common case for DB rows)
+    if value is None:
+        return default
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        # NaN and ±inf have no int value
+        return int(value) if math.isfinite(value) else default
     try:
         if pd.isna(value):
             return default
@@ -335,18 +441,74 @@ def safe_int(value, default=0):
 
 def safe_float(value, default=0.0):
     """Safely convert to float"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return default if value != value else float(value)
     try:
-        if value is None or pd.isna(value):
+        if pd.isna(value):
             return default
         return float(value)
     except:
         return default
 
+@st.cache_data(ttl=300, max_entries=16)
+def build_export_file(entity_id, customer_id, product_id, status, role, session_customer_id):
+    """Build export workbook bytes for a filter set.
+    
+    role and session_customer_id restrict customer users to their own rules
+    and keep the row limit per role, so one user's file is never served to another.
+    """
+    export_filters = {
+        'entity_id': entity_id,
+        'customer_id': customer_id,
+        'status': status
+    }
+    if product_id:
+        export_filters['product_id'] = product_id
+    
+    if role == 'customer':
+        export_filters['restrict_customer_id'] = session_customer_id
+    
+    df = get_safety_stock_levels(**export_filters)
+    df, was_limited = apply_export_limit(df)
+    
+    if df.empty:
+        return None, 0, was_limited
+    
+    return export_to_excel(df).getvalue(), len(df), was_limited
+
+@st.cache_data(ttl=300, max_entries=4, show_spinner="Building report...")
+def build_review_report(report_day: str):
+    """Build review report bytes for a day (YYYYMMDD); writes clear it through clear_safety_stock_caches"""
+    return generate_review_report().getvalue()
+
+@st.cache_data(ttl=300, max_entries=4, show_spinner=False)
+def read_and_validate_upload(file_hash: str, _file_bytes: bytes):
+    """Read and validate an upload once per distinct file content (keyed on file_hash)"""
+    df = read_upload_file(io.BytesIO(_file_bytes))
+    is_valid, validated_df, errors = validate_bulk_data(df)
+    return df, is_valid, validated_df, errors
+
+def clear_safety_stock_caches(include_filter_options: bool = True):
+    """Invalidate only the caches derived from safety_stock_levels after a write"""
+    get_quick_stats.clear()
+    clear_safety_stock_level_caches()
+    clear_historical_demand_cache()
+    build_export_file.clear()
+    build_review_report.clear()
+    # The session's prepared report predates the write
+    st.session_state.pop('ss_report', None)
+    # Duplicate checks in a cached validation go stale once records change
+    read_and_validate_upload.clear()
+    if include_filter_options:
+        load_existing_filter_options.clear()
+
 # ==================== Helper function for fetching data ====================
 
 def fetch_and_store_demand_data(product_id, entity_id, customer_id, fetch_days, exclude_pending):
     """Helper function to fetch demand data and store in session state"""
-    stats = fetch_demand_stats(
+    stats, lead_time_info = fetch_demand_and_lead_time(
         product_id=product_id,
         entity_id=entity_id,
         customer_id=customer_id,
@@ -354,12 +516,6 @@ def fetch_and_store_demand_data(product_id, entity_id, customer_id, fetch_days,
         exclude_pending=exclude_pending
     )
     
-    lead_time_info = get_lead_time_estimate(
-        product_id=product_id,
-        entity_id=entity_id,
-        customer_id=customer_id
-    )
-    
     # Store in dialog_data instead of temp_demand_data
     st.session_state.dialog_data['demand_stats'] = stats
     if lead_time_info['sample_size'] > 0:
@@ -384,22 +540,23 @@ def safety_stock_form(mode='add', record_id=None):
         st.error(get_permission_message(required_permission))
         return
     
-    # Initialize dialog data if new
+    # Initialize dialog data if new; the edited record is read once per dialog, not per rerun
     if 'initialized' not in st.session_state.dialog_data:
         st.session_state.dialog_data = {
             'initialized': True,
             'mode': mode,
-            'record_id': record_id
+            'record_id': record_id,
+            'existing_data': (get_safety_stock_by_id(record_id) or {}) if mode == 'edit' and record_id else {}
         }
     
-    existing_data = {}
-    if mode == 'edit' and record_id:
-        existing_data = get_safety_stock_by_id(record_id) or {}
+    # Local alias - same dict, avoids a SessionStateProxy lookup on every access below
+    dialog_data = st.session_state.dialog_data
+    existing_data = dialog_data['existing_data']
     
+    # Entities are always needed; customers/products are loaded where they are used
     entities = load_entities()
-    customers = load_customers()
     
-    if entities.empty:
+    if not entities.ids:
         st.error("Unable to load required data")
         return
     
@@ -414,31 +571,38 @@ def safety_stock_form(mode='add', record_id=None):
         with col1:
             # Product selection - simple searchable selectbox
             if mode == 'add':
-                # Load all products once
-                product_options, product_id_map = load_all_products_for_select()
+                # Search in the database first, then pick from the top matches
+                product_search = st.text_input(
+                    "Search Product *",
+                    placeholder="Type at least 2 characters of PT code or name...",
+                    key="product_search_input"
+                ).strip()
+                product_id = None
                 
-                if not product_options:
-                    st.error("No products available")
-                    product_id = None
+                if len(product_search) < 2:
+                    st.info("Type at least 2 characters to search products")
                 else:
-                    # Streamlit selectbox with built-in search
-                    selected_option = st.selectbox(
-                        "Product * (type to search)",
-                        options=product_options,
-                        index=None,  # No default selection
-                        placeholder="Type PT code or name to search...",
-                        key="product_selectbox",
-                        help=f"Total {len(product_options)} products available"
-                    )
+                    product_options, product_id_map = search_products(product_search)
                     
-                    if selected_option:
-                        product_id = product_id_map.get(selected_option)
-                        # Extract PT code for display
-                        pt_code = selected_option.split(" | ")[0]
-                        st.success(f"✓ Selected: {pt_code}")
+                    if not product_options:
+                        st.warning(f"No products match '{product_search}'")
                     else:
-                        product_id = None
-                        st.warning("Please select a product")
+                        selected_option = st.selectbox(
+                            "Product *",
+                            options=product_options,
+                            index=None,  # No default selection
+                            placeholder="Select a product...",
+                            key="product_selectbox",
+                            help=f"Showing {len(product_options)} matches (max 50)"
+                        )
+                        
+                        if selected_option:
+                            product_id = product_id_map.get(selected_option)
+                            # Extract PT code for display
+                            pt_code = selected_option.split(" | ")[0]
+                            st.success(f"✓ Selected: {pt_code}")
+                        else:
+                            st.warning("Please select a product")
             else:
                 # Edit mode - show existing product
                 st.text_input(
@@ -448,47 +612,38 @@ def safety_stock_form(mode='add', record_id=None):
                 )
                 product_id = existing_data['product_id']
             
-            # Entity selection
-            entity_options = entities['company_code'] + ' - ' + entities['english_name']
+            # Entity selection - labels are the options, mapped back to ids by dict
+            entity_options = entities.display_texts
             entity_idx = 0
-            if mode == 'edit' and existing_data.get('entity_id'):
-                try:
-                    matches = entities[entities['id'] == existing_data['entity_id']]
-                    if not matches.empty:
-                        entity_idx = safe_int(matches.index[0])
-                except Exception as e:
-                    logger.error(f"Error finding entity: {e}")
+            if mode == 'edit':
+                entity_idx = entities.index_by_id.get(existing_data.get('entity_id'), 0)
             
             selected_entity = st.selectbox(
                 "Entity *",
-                options=range(len(entities)),
-                format_func=lambda x: entity_options.iloc[x],
+                options=entity_options,
                 index=entity_idx,
                 disabled=(mode == 'edit')
             )
-            entity_id = entities.iloc[selected_entity]['id']
+            entity_id = entities.id_by_text.get(selected_entity)
         
         with col2:
             # Customer selection
-            customer_options = ['General Rule (All Customers)'] + \
-                              (customers['company_code'] + ' - ' + customers['english_name']).tolist()
+            customers = load_customers()
+            customer_options = ['General Rule (All Customers)'] + customers.display_texts
             
             customer_idx = 0
             if mode == 'edit' and existing_data.get('customer_id'):
-                try:
-                    matches = customers[customers['id'] == existing_data['customer_id']]
-                    if not matches.empty:
-                        customer_idx = safe_int(matches.index[0]) + 1
-                except Exception as e:
-                    logger.error(f"Error finding customer: {e}")
+                customer_pos = customers.index_by_id.get(existing_data['customer_id'])
+                if customer_pos is not None:
+                    customer_idx = customer_pos + 1
             
             selected_customer = st.selectbox(
                 "Customer (Optional)",
-                options=range(len(customer_options)),
-                format_func=lambda x: customer_options[x],
+                options=customer_options,
                 index=customer_idx
             )
-            customer_id = None if selected_customer == 0 else customers.iloc[selected_customer - 1]['id']
+            # General Rule is not in the map, so it resolves to None
+            customer_id = customers.id_by_text.get(selected_customer)
             
             # Priority
             default_priority = 100 if customer_id is None else 50
@@ -496,7 +651,7 @@ def safety_stock_form(mode='add', record_id=None):
                 "Priority Level",
                 min_value=1,
                 max_value=9999,
-                value=safe_int(existing_data.get('priority_level', default_priority)),
+                value=safe_int(existing_data.get('priority_level'), default_priority),
                 help="Lower = higher priority. Customer rules ≤ 500"
             )
         
@@ -505,7 +660,7 @@ def safety_stock_form(mode='add', record_id=None):
         with col1:
             effective_from = st.date_input(
                 "Effective From *",
-                value=existing_data.get('effective_from', datetime.now().date())
+                value=existing_data.get('effective_from') or datetime.now().date()
             )
         with col2:
             effective_to = st.date_input(
@@ -516,7 +671,7 @@ def safety_stock_form(mode='add', record_id=None):
         # Notes
         business_notes = st.text_area(
             "Business Notes",
-            value=existing_data.get('business_notes', ''),
+            value=existing_data.get('business_notes') or '',
             height=100
         )
     
@@ -548,11 +703,11 @@ def safety_stock_form(mode='add', record_id=None):
                         stats, lead_time_info = fetch_and_store_demand_data(
                             product_id, entity_id, customer_id, fetch_days, exclude_pending
                         )
-                        st.session_state.dialog_data['data_fetched'] = True
+                        dialog_data['data_fetched'] = True
         
         # Display fetched data if available
-        if st.session_state.dialog_data.get('data_fetched') and st.session_state.dialog_data.get('demand_stats'):
-            stats = st.session_state.dialog_data['demand_stats']
+        if dialog_data.get('data_fetched') and dialog_data.get('demand_stats'):
+            stats = dialog_data['demand_stats']
             
             if stats.get('data_points', 0) > 0:
                 st.success(f"✔ Found {stats['data_points']} delivery dates")
@@ -571,8 +726,8 @@ def safety_stock_form(mode='add', record_id=None):
                 st.info(f"💡 Suggested method: **{stats['suggested_method']}** | Range: {stats['min_daily_demand']:.0f} - {stats['max_daily_demand']:.0f} units/day")
                 
                 # Lead time
-                if 'lead_time_info' in st.session_state.dialog_data:
-                    lead_info = st.session_state.dialog_data['lead_time_info']
+                if 'lead_time_info' in dialog_data:
+                    lead_info = dialog_data['lead_time_info']
                     st.success(f"📦 Estimated lead time: **{lead_info['avg_lead_time_days']:.0f} days** (from {lead_info['sample_size']} deliveries)")
         
         st.divider()
@@ -581,24 +736,23 @@ def safety_stock_form(mode='add', record_id=None):
         st.markdown("#### Calculation Method")
         
         # Get method from dialog_data or existing_data
-        current_method = st.session_state.dialog_data.get('selected_method', existing_data.get('calculation_method', 'FIXED'))
+        current_method = dialog_data.get('selected_method', existing_data.get('calculation_method') or 'FIXED')
         
-        if st.session_state.dialog_data.get('data_fetched'):
+        if dialog_data.get('data_fetched'):
             st.info(f"✅ Method auto-selected based on demand analysis: **{current_method}**")
         
-        methods = ['FIXED', 'DAYS_OF_SUPPLY', 'LEAD_TIME_BASED']
         calculation_method = st.selectbox(
             "Select Calculation Method",
-            options=methods,
-            index=methods.index(current_method),
+            options=CALCULATION_METHODS,
+            index=_METHOD_IDX.get(current_method, 0),
             key="calc_method_select"
         )
         
         # Store selected method
-        st.session_state.dialog_data['selected_method'] = calculation_method
+        dialog_data['selected_method'] = calculation_method
         
         # Get auto-fill data
-        demand_stats = st.session_state.dialog_data.get('demand_stats', {})
+        demand_stats = dialog_data.get('demand_stats', {})
         has_auto_data = bool(demand_stats and demand_stats.get('data_points', 0) > 0)
         
         # Parameters
@@ -610,7 +764,7 @@ def safety_stock_form(mode='add', record_id=None):
                 safety_stock_qty = st.number_input(
                     "Safety Stock Quantity *",
                     min_value=0.0,
-                    value=safe_float(existing_data.get('safety_stock_qty', 0)),
+                    value=safe_float(existing_data.get('safety_stock_qty')),
                     step=1.0,
                     key="ss_qty_fixed"
                 )
@@ -618,7 +772,7 @@ def safety_stock_form(mode='add', record_id=None):
                 reorder_point = st.number_input(
                     "Reorder Point",
                     min_value=0.0,
-                    value=safe_float(existing_data.get('reorder_point', 0)),
+                    value=safe_float(existing_data.get('reorder_point')),
                     step=1.0,
                     key="rop_fixed"
                 )
@@ -633,7 +787,7 @@ def safety_stock_form(mode='add', record_id=None):
                 safety_days = st.number_input(
                     "Safety Days *",
                     min_value=1,
-                    value=safe_int(existing_data.get('safety_days', 14)),
+                    value=safe_int(existing_data.get('safety_days'), 14),
                     key="safety_days_dos"
                 )
                 
@@ -647,9 +801,9 @@ def safety_stock_form(mode='add', record_id=None):
             
             with col2:
                 lead_time_days = st.number_input(
-                    "Lead Time (days)" + (" ✔" if has_auto_data and 'lead_time_days' in st.session_state.dialog_data else ""),
+                    "Lead Time (days)" + (" ✔" if has_auto_data and 'lead_time_days' in dialog_data else ""),
                     min_value=1,
-                    value=safe_int(st.session_state.dialog_data.get('lead_time_days', 7) if has_auto_data else existing_data.get('lead_time_days', 7)),
+                    value=safe_int(dialog_data.get('lead_time_days', 7) if has_auto_data else existing_data.get('lead_time_days'), 7),
                     key="lt_dos"
                 )
             
@@ -663,16 +817,11 @@ def safety_stock_form(mode='add', record_id=None):
                 )
                 
                 if 'error' not in result:
-                    st.session_state.dialog_data['calculated_ss'] = result['safety_stock_qty']
-                    st.session_state.dialog_data['calculated_rop'] = result['reorder_point']
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.success(f"✔ Safety Stock: **{result['safety_stock_qty']:.2f}** units")
-                    with col2:
-                        st.success(f"✔ Reorder Point: **{result['reorder_point']:.2f}** units")
+                    dialog_data['calculated_ss'] = result['safety_stock_qty']
+                    dialog_data['calculated_rop'] = result['reorder_point']
                     
-                    st.caption(f"Formula: {result['formula_used']}")
+                    # Values land in the inputs below; just show how they were derived
+                    st.caption(f"✔ Calculated - Formula: {result['formula_used']}")
                 else:
                     st.error(result['error'])
             
@@ -680,17 +829,17 @@ def safety_stock_form(mode='add', record_id=None):
             col1, col2 = st.columns(2)
             with col1:
                 safety_stock_qty = st.number_input(
-                    "Safety Stock Quantity" + (" ✔" if 'calculated_ss' in st.session_state.dialog_data else ""),
+                    "Safety Stock Quantity" + (" ✔" if 'calculated_ss' in dialog_data else ""),
                     min_value=0.0,
-                    value=safe_float(st.session_state.dialog_data.get('calculated_ss', existing_data.get('safety_stock_qty', 0))),
+                    value=safe_float(dialog_data.get('calculated_ss', existing_data.get('safety_stock_qty', 0))),
                     step=1.0,
                     key="ss_qty_dos"
                 )
             with col2:
                 reorder_point = st.number_input(
-                    "Reorder Point" + (" ✔" if 'calculated_rop' in st.session_state.dialog_data else ""),
+                    "Reorder Point" + (" ✔" if 'calculated_rop' in dialog_data else ""),
                     min_value=0.0,
-                    value=safe_float(st.session_state.dialog_data.get('calculated_rop', existing_data.get('reorder_point', 0))),
+                    value=safe_float(dialog_data.get('calculated_rop', existing_data.get('reorder_point', 0))),
                     step=1.0,
                     key="rop_dos"
                 )
@@ -709,20 +858,18 @@ def safety_stock_form(mode='add', record_id=None):
             col1, col2 = st.columns(2)
             with col1:
                 lead_time_days = st.number_input(
-                    "Lead Time (days) *" + (" ✔" if has_auto_data and 'lead_time_days' in st.session_state.dialog_data else ""),
+                    "Lead Time (days) *" + (" ✔" if has_auto_data and 'lead_time_days' in dialog_data else ""),
                     min_value=1,
-                    value=safe_int(st.session_state.dialog_data.get('lead_time_days', 7) if has_auto_data else existing_data.get('lead_time_days', 7)),
+                    value=safe_int(dialog_data.get('lead_time_days', 7) if has_auto_data else existing_data.get('lead_time_days'), 7),
                     key="lt_ltb"
                 )
                 
-                service_level_options = list(Z_SCORE_MAP.keys())
                 current_sl = existing_data.get('service_level_percent', 95.0)
-                sl_idx = service_level_options.index(current_sl) if current_sl in service_level_options else 4
                 
                 service_level_percent = st.selectbox(
                     "Service Level % *",
-                    options=service_level_options,
-                    index=sl_idx,
+                    options=_SERVICE_LEVEL_OPTIONS,
+                    index=_SERVICE_LEVEL_INDEX.get(current_sl, 4),
                     key="sl_ltb"
                 )
             
@@ -754,16 +901,11 @@ def safety_stock_form(mode='add', record_id=None):
                 )
                 
                 if 'error' not in result:
-                    st.session_state.dialog_data['calculated_ss'] = result['safety_stock_qty']
-                    st.session_state.dialog_data['calculated_rop'] = result['reorder_point']
+                    dialog_data['calculated_ss'] = result['safety_stock_qty']
+                    dialog_data['calculated_rop'] = result['reorder_point']
                     
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.success(f"✔ Safety Stock: **{result['safety_stock_qty']:.2f}** units")
-                    with col2:
-                        st.success(f"✔ Reorder Point: **{result['reorder_point']:.2f}** units")
-                    
-                    st.caption(f"Formula: {result['formula_used']}")
+                    # Values land in the inputs below; just show how they were derived
+                    st.caption(f"✔ Calculated - Formula: {result['formula_used']}")
                 else:
                     st.error(result['error'])
             
@@ -771,17 +913,17 @@ def safety_stock_form(mode='add', record_id=None):
             col1, col2 = st.columns(2)
             with col1:
                 safety_stock_qty = st.number_input(
-                    "Safety Stock Quantity" + (" ✔" if 'calculated_ss' in st.session_state.dialog_data else ""),
+                    "Safety Stock Quantity" + (" ✔" if 'calculated_ss' in dialog_data else ""),
                     min_value=0.0,
-                    value=safe_float(st.session_state.dialog_data.get('calculated_ss', existing_data.get('safety_stock_qty', 0))),
+                    value=safe_float(dialog_data.get('calculated_ss', existing_data.get('safety_stock_qty', 0))),
                     step=1.0,
                     key="ss_qty_ltb"
                 )
             with col2:
                 reorder_point = st.number_input(
-                    "Reorder Point" + (" ✔" if 'calculated_rop' in st.session_state.dialog_data else ""),
+                    "Reorder Point" + (" ✔" if 'calculated_rop' in dialog_data else ""),
                     min_value=0.0,
-                    value=safe_float(st.session_state.dialog_data.get('calculated_rop', existing_data.get('reorder_point', 0))),
+                    value=safe_float(dialog_data.get('calculated_rop', existing_data.get('reorder_point', 0))),
                     step=1.0,
                     key="rop_ltb"
                 )
@@ -837,7 +979,7 @@ def safety_stock_form(mode='add', record_id=None):
                     # Clear dialog data
                     st.session_state.dialog_data = {}
                     st.success(f"{'Created' if mode == 'add' else 'Updated'} successfully!")
-                    st.cache_data.clear()
+                    clear_safety_stock_caches()
                     st.rerun()
                 else:
                     st.error(f"Error: {result}")
@@ -853,6 +995,7 @@ def safety_stock_form(mode='add', record_id=None):
     with col3:
         if mode == 'edit' and has_permission('review'):
             if st.button("Create Review", use_container_width=True):
+                st.session_state.dialog_data = {}
                 review_dialog(record_id)
 
 
@@ -864,7 +1007,11 @@ def review_dialog(safety_stock_id):
         st.error(get_permission_message('review'))
         return
     
-    current_data = get_safety_stock_by_id(safety_stock_id)
+    # Snapshot the record for the life of the dialog so typing in it doesn't re-query
+    dialog_data = st.session_state.dialog_data
+    if 'review_record' not in dialog_data:
+        dialog_data['review_record'] = get_safety_stock_by_id(safety_stock_id)
+    current_data = dialog_data['review_record']
     if not current_data:
         st.error("Record not found")
         return
@@ -876,13 +1023,13 @@ def review_dialog(safety_stock_id):
     st.subheader("Current Information")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Product", current_data.get('pt_code', 'N/A'))
+        st.metric("Product", current_data.get('pt_code') or 'N/A')
     with col2:
-        st.metric("Entity", current_data.get('entity_name', 'N/A')[:20])
+        st.metric("Entity", (current_data.get('entity_name') or 'N/A')[:20])
     with col3:
         st.metric("Current Qty", f"{safe_float(current_data.get('safety_stock_qty')):.0f}")
     with col4:
-        st.metric("Method", current_data.get('calculation_method', 'FIXED'))
+        st.metric("Method", current_data.get('calculation_method') or 'FIXED')
     
     # Show additional context
     with st.expander("View Current Settings", expanded=False):
@@ -920,11 +1067,10 @@ def review_dialog(safety_stock_id):
         else:
             default_action = 'NO_CHANGE'
         
-        action_idx = ['NO_CHANGE', 'INCREASED', 'DECREASED', 'METHOD_CHANGED'].index(default_action)
         action_taken = st.selectbox(
             "Action *",
-            options=['NO_CHANGE', 'INCREASED', 'DECREASED', 'METHOD_CHANGED'],
-            index=action_idx,
+            options=REVIEW_ACTIONS,
+            index=_ACTION_IDX[default_action],
             help="System auto-detected based on quantity change"
         )
         
@@ -995,28 +1141,26 @@ def review_dialog(safety_stock_id):
                 'approved_by': st.session_state.username if approve_review else None
             }
             
-            # Create review record
-            success, message = create_safety_stock_review(
+            # Create review record and apply the new quantity atomically
+            success, message = submit_safety_stock_review(
                 safety_stock_id,
                 review_data,
                 st.session_state.username
             )
             
             if success:
-                # Update quantity if changed
-                if new_safety_stock_qty != old_qty:
-                    update_data = {'safety_stock_qty': new_safety_stock_qty}
-                    update_safety_stock(safety_stock_id, update_data, st.session_state.username)
-                
                 log_action('REVIEW', f"Reviewed safety stock ID {safety_stock_id}")
                 st.success("✅ Review submitted successfully!")
-                st.cache_data.clear()
+                st.session_state.dialog_data = {}
+                # A review only changes quantities, so filter options stay valid
+                clear_safety_stock_caches(include_filter_options=False)
                 st.rerun()
             else:
                 st.error(f"⚠️ Error: {message}")
     
     with col2:
         if st.button("Cancel", use_container_width=True):
+            st.session_state.dialog_data = {}
             st.rerun()
 
 
@@ -1048,18 +1192,16 @@ def bulk_upload_dialog():
     
     if uploaded_file:
         try:
-            with st.spinner("Reading file..."):
-                df = pd.read_excel(uploaded_file)
-            
-            if df.iloc[0].astype(str).str.contains('Required|Optional').any():
-                df = df.iloc[1:].reset_index(drop=True)
+            # Read + validate once per file; the Import click rerun is a cache hit
+            file_bytes = uploaded_file.getvalue()
+            with st.spinner("Reading and validating file..."):
+                df, is_valid, validated_df, errors = read_and_validate_upload(
+                    hashlib.md5(file_bytes).hexdigest(), file_bytes
+                )
             
             st.info(f"Found {len(df)} rows")
             st.dataframe(df.head(10), use_container_width=True)
             
-            with st.spinner("Validating..."):
-                is_valid, validated_df, errors = validate_bulk_data(df)
-            
             if not is_valid:
                 st.error("Validation failed:")
                 for error in errors[:10]:
@@ -1082,7 +1224,7 @@ def bulk_upload_dialog():
                             with st.expander("Errors"):
                                 for error in results['errors']:
                                     st.write(f"• {error}")
-                        st.cache_data.clear()
+                        clear_safety_stock_caches()
                         st.rerun()
                     else:
                         st.error(f"Failed: {message}")
@@ -1091,8 +1233,148 @@ def bulk_upload_dialog():
             st.error(f"Error: {e}")
 
 
+@st.dialog("Delete Safety Stock")
+def delete_dialog(safety_stock_id):
+    """Confirm and delete a safety stock rule"""
+    
+    st.warning(f"Delete safety stock rule ID {safety_stock_id}? This cannot be undone.")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Confirm Delete", type="primary", use_container_width=True):
+            success, msg = delete_safety_stock(safety_stock_id, st.session_state.username)
+            if success:
+                log_action('DELETE', f"Deleted safety stock ID {safety_stock_id}")
+                st.success("Deleted successfully")
+                clear_safety_stock_caches()
+                st.rerun()
+            else:
+                st.error(msg)
+    
+    with col2:
+        if st.button("Cancel", use_container_width=True):
+            st.rerun()
+
+
 # ==================== Main Page ====================
 
+@st.fragment
+def _render_table():
+    """Data table and row actions - reruns on its own when the user pages or selects a row"""
+    # Get filtered data
+    filters = {
+        'entity_id': st.session_state.ss_filters['entity_id'],
+        'customer_id': None if st.session_state.ss_filters['customer_id'] == 'general' else st.session_state.ss_filters['customer_id'],
+        'status': st.session_state.ss_filters['status'],
+        'restrict_customer_id': get_restricted_customer_id()
+    }
+    
+    if st.session_state.ss_filters.get('product_id'):
+        filters['product_id'] = st.session_state.ss_filters['product_id']
+    elif st.session_state.ss_filters.get('product_search'):
+        filters['product_search'] = st.session_state.ss_filters['product_search']
+    
+    # Go back to the first page whenever the filters change
+    filter_key = tuple(sorted(filters.items()))
+    if st.session_state.get('ss_page_filter_key') != filter_key:
+        st.session_state.ss_page_filter_key = filter_key
+        st.session_state.ss_filters['page'] = 0
+    page = st.session_state.ss_filters.get('page', 0)
+    
+    df = get_safety_stock_levels(
+        **filters, limit=PAGE_SIZE, offset=page * PAGE_SIZE, columns=TABLE_COLUMNS
+    )
+    
+    # A short first page already is the whole result, so skip the COUNT round trip
+    if page == 0 and len(df) < PAGE_SIZE:
+        total_records = len(df)
+    else:
+        total_records = count_safety_stock_levels(**filters)
+    page_count = max(1, -(-total_records // PAGE_SIZE))
+    
+    # Data shrank since the page was chosen - fall back to the last page
+    if page >= page_count:
+        page = page_count - 1
+        st.session_state.ss_filters['page'] = page
+        df = get_safety_stock_levels(
+            **filters, limit=PAGE_SIZE, offset=page * PAGE_SIZE, columns=TABLE_COLUMNS
+        )
+    
+    if df.empty:
+        st.info("No records found")
+    else:
+        display_df = df[list(TABLE_COLUMNS)].assign(
+            customer_code=df['customer_code'].fillna('All')
+        ).astype(TABLE_CATEGORY_COLUMNS)
+        
+        st.subheader(f"Safety Stock Rules ({total_records} records)")
+        
+        if page_count > 1:
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("Previous", use_container_width=True, disabled=page == 0):
+                    st.session_state.ss_filters['page'] = page - 1
+                    st.rerun(scope="fragment")
+            with col2:
+                st.caption(f"Page {page + 1} of {page_count}")
+            with col3:
+                if st.button("Next", use_container_width=True, disabled=page >= page_count - 1):
+                    st.session_state.ss_filters['page'] = page + 1
+                    st.rerun(scope="fragment")
+        
+        # on_select must stay "rerun": "ignore" turns selection reporting off entirely.
+        # Repeat runs are cheap because the level query is cached.
+        selected = st.dataframe(
+            display_df,
+            key="ss_grid",
+            use_container_width=True,
+            hide_index=True,
+            selection_mode="single-row",
+            on_select="rerun"
+        )
+        
+        if selected and selected.selection.rows:
+            # Actions only need the id - avoid building a Series for the whole row
+            record_id = df['id'].tolist()[selected.selection.rows[0]]
+            
+            st.divider()
+            st.subheader("Actions")
+            
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                if st.button("Edit", 
+                           use_container_width=True,
+                           disabled=not has_permission('edit')):
+                    # Clear dialog data before opening
+                    st.session_state.dialog_data = {}
+                    safety_stock_form('edit', record_id)
+            
+            with col2:
+                if st.button("Review", 
+                           use_container_width=True,
+                           disabled=not has_permission('review')):
+                    st.session_state.dialog_data = {}
+                    review_dialog(record_id)
+            
+            with col3:
+                # A toggle rather than an expander: expander bodies run even while collapsed
+                if st.toggle("History", key=f"show_history_{record_id}"):
+                    history = get_review_history(record_id)
+                    if not history.empty:
+                        st.dataframe(history, use_container_width=True)
+                    else:
+                        st.info("No review history")
+            
+            with col4:
+                if st.button("Delete", 
+                           type="secondary",
+                           use_container_width=True,
+                           disabled=not has_permission('delete')):
+                    delete_dialog(record_id)
+
+
 def main():
     st.title("📦 Safety Stock Management")
     
@@ -1101,18 +1383,27 @@ def main():
     with col2:
         st.caption(get_user_info_display())
     
+    # Reference data is cached for an hour - allow a manual reload
+    with st.sidebar:
+        if st.button("Reload reference data",
+                    use_container_width=True,
+                    help="Re-read entities, customers and products from the database"):
+            _load_reference_data.clear()
+            search_products.clear()
+            st.rerun()
+    
     # Stats
     stats = get_quick_stats()
     if stats:
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Active Rules", stats.total_items or 0)
+            st.metric("Active Rules", stats['total_items'] or 0)
         with col2:
-            st.metric("Customer Rules", stats.customer_rules or 0)
+            st.metric("Customer Rules", stats['customer_rules'] or 0)
         with col3:
-            st.metric("Needs Review", stats.needs_review or 0)
+            st.metric("Needs Review", stats['needs_review'] or 0)
         with col4:
-            st.metric("Unique Products", stats.unique_products or 0)
+            st.metric("Unique Products", stats['unique_products'] or 0)
     
     st.divider()
     
@@ -1132,8 +1423,7 @@ def main():
             if selected_entity == 'All Entities':
                 st.session_state.ss_filters['entity_id'] = None
             else:
-                entity_id = existing_filters['entity_ids'][existing_filters['entities'].index(selected_entity)]
-                st.session_state.ss_filters['entity_id'] = entity_id
+                st.session_state.ss_filters['entity_id'] = existing_filters['entity_map'][selected_entity]
         
         with col2:
             # Customer filter
@@ -1142,13 +1432,9 @@ def main():
             # Filter for customer role
             if get_user_role() == 'customer':
                 customer_id = st.session_state.get('customer_id')
-                if customer_id and existing_filters['customers']:
-                    # Find matching customer name
-                    for i, cust_id in enumerate(existing_filters['customer_ids']):
-                        if cust_id == customer_id:
-                            customer_name = existing_filters['customers'][i]
-                            customer_opts = [customer_name]
-                            break
+                customer_name = existing_filters['customer_names'].get(customer_id)
+                if customer_name is not None:
+                    customer_opts = [customer_name]
             
             selected_customer = st.selectbox("Customer", customer_opts)
             
@@ -1157,8 +1443,8 @@ def main():
             elif selected_customer == 'General Rules Only':
                 st.session_state.ss_filters['customer_id'] = 'general'
             else:
-                if selected_customer in existing_filters['customers']:
-                    customer_id = existing_filters['customer_ids'][existing_filters['customers'].index(selected_customer)]
+                customer_id = existing_filters['customer_map'].get(selected_customer)
+                if customer_id is not None:
                     st.session_state.ss_filters['customer_id'] = customer_id
         
         with col3:
@@ -1180,8 +1466,8 @@ def main():
                 st.session_state.ss_filters['product_id'] = None
                 st.session_state.ss_filters['product_search'] = ''
             else:
-                if selected_product in existing_filters['products']:
-                    product_id = existing_filters['product_ids'][existing_filters['products'].index(selected_product)]
+                product_id = existing_filters['product_map'].get(selected_product)
+                if product_id is not None:
                     st.session_state.ss_filters['product_id'] = product_id
                     st.session_state.ss_filters['product_search'] = ''
         
@@ -1224,140 +1510,74 @@ def main():
             bulk_upload_dialog()
     
     with col3:
+        filters = st.session_state.ss_filters
+        export_key = (
+            filters['entity_id'],
+            None if filters['customer_id'] == 'general' else filters['customer_id'],
+            filters.get('product_id'),
+            filters['status'],
+            get_user_role(),
+            st.session_state.get('customer_id')
+        )
+        
         if st.button("Export Excel", use_container_width=True):
-            export_filters = {
-                'entity_id': st.session_state.ss_filters['entity_id'],
-                'customer_id': None if st.session_state.ss_filters['customer_id'] == 'general' else st.session_state.ss_filters['customer_id'],
-                'status': st.session_state.ss_filters['status']
+            excel_file, row_count, was_limited = build_export_file(*export_key)
+            st.session_state.ss_export = {
+                'key': export_key,
+                'data': excel_file,
+                'rows': row_count,
+                'limited': was_limited,
+                'file_name': f"safety_stock_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
             }
+            if excel_file is not None:
+                log_action('EXPORT', f"Exported {row_count} records")
+        
+        # Keep the prepared file across reruns (e.g. the Download click) until filters change
+        export = st.session_state.get('ss_export')
+        if export and export['key'] == export_key:
+            if export['limited']:
+                st.warning(f"Export limited to {export['rows']} rows based on your role")
             
-            if st.session_state.ss_filters.get('product_id'):
-                export_filters['product_id'] = st.session_state.ss_filters['product_id']
-            
-            df = get_safety_stock_levels(**export_filters)
-            df = filter_data_for_customer(df)
-            df, was_limited = apply_export_limit(df)
-            
-            if was_limited:
-                st.warning(f"Export limited to {len(df)} rows based on your role")
-            
-            if not df.empty:
-                excel_file = export_to_excel(df)
+            if export['data'] is not None:
                 st.download_button(
                     "Download",
-                    excel_file,
-                    f"safety_stock_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                    export['data'],
+                    export['file_name'],
                     "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     use_container_width=True
                 )
-                log_action('EXPORT', f"Exported {len(df)} records")
             else:
                 st.warning("No data to export")
     
     with col4:
+        report_day = datetime.now().strftime('%Y%m%d')
         if st.button("Review Report", use_container_width=True):
-            report = generate_review_report()
+            st.session_state.ss_report = {
+                'key': report_day,
+                'data': build_review_report(report_day)
+            }
+        
+        # Keep the prepared report across reruns until the day changes
+        report = st.session_state.get('ss_report')
+        if report and report['key'] == report_day:
             st.download_button(
                 "Download",
-                report,
-                f"review_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                report['data'],
+                f"review_{report['key']}.xlsx",
                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="download_review_report",
                 use_container_width=True
             )
     
     with col5:
         if st.button("Refresh", use_container_width=True):
-            st.cache_data.clear()
+            clear_safety_stock_caches()
             st.session_state.dialog_data = {}
             st.rerun()
     
     # Data table
     st.divider()
-    
-    # Get filtered data
-    filters = {
-        'entity_id': st.session_state.ss_filters['entity_id'],
-        'customer_id': None if st.session_state.ss_filters['customer_id'] == 'general' else st.session_state.ss_filters['customer_id'],
-        'status': st.session_state.ss_filters['status']
-    }
-    
-    if st.session_state.ss_filters.get('product_id'):
-        filters['product_id'] = st.session_state.ss_filters['product_id']
-    elif st.session_state.ss_filters.get('product_search'):
-        filters['product_search'] = st.session_state.ss_filters['product_search']
-    
-    df = get_safety_stock_levels(**filters)
-    df = filter_data_for_customer(df)
-    
-    if df.empty:
-        st.info("No records found")
-    else:
-        # Display columns
-        display_cols = [
-            'pt_code', 'product_name', 'entity_code', 'customer_code',
-            'safety_stock_qty', 'reorder_point',
-            'calculation_method', 'rule_type', 
-            'status', 'effective_from', 'priority_level'
-        ]
-        
-        display_df = df[display_cols].copy()
-        display_df['customer_code'] = display_df['customer_code'].fillna('All')
-        
-        st.subheader(f"Safety Stock Rules ({len(df)} records)")
-        
-        selected = st.dataframe(
-            display_df,
-            use_container_width=True,
-            hide_index=True,
-            selection_mode="single-row",
-            on_select="rerun"
-        )
-        
-        if selected and selected.selection.rows:
-            idx = selected.selection.rows[0]
-            record = df.iloc[idx]
-            
-            st.divider()
-            st.subheader("Actions")
-            
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                if st.button("Edit", 
-                           use_container_width=True,
-                           disabled=not has_permission('edit')):
-                    # Clear dialog data before opening
-                    st.session_state.dialog_data = {}
-                    safety_stock_form('edit', record['id'])
-            
-            with col2:
-                if st.button("Review", 
-                           use_container_width=True,
-                           disabled=not has_permission('review')):
-                    review_dialog(record['id'])
-            
-            with col3:
-                if st.button("History", use_container_width=True):
-                    history = get_review_history(record['id'])
-                    if not history.empty:
-                        st.dataframe(history, use_container_width=True)
-                    else:
-                        st.info("No review history")
-            
-            with col4:
-                if st.button("Delete", 
-                           type="secondary",
-                           use_container_width=True,
-                           disabled=not has_permission('delete')):
-                    if st.checkbox("Confirm delete?"):
-                        success, msg = delete_safety_stock(record['id'], st.session_state.username)
-                        if success:
-                            log_action('DELETE', f"Deleted safety stock ID {record['id']}")
-                            st.success("Deleted successfully")
-                            st.cache_data.clear()
-                            st.rerun()
-                        else:
-                            st.error(msg)
+    _render_table()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 # utils/db.py
 
 import pandas as pd
+from functools import lru_cache
 from sqlalchemy import create_engine
 from urllib.parse import quote_plus
 import logging
@@ -9,8 +10,9 @@ from .config import DB_CONFIG
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
 def get_db_engine():
-    """Create and return SQLAlchemy database engine"""
+    """Create (once per process) and return the pooled SQLAlchemy database engine"""
     logger.info("🔌 Connecting to database...")
 
     user = DB_CONFIG["user"]
@@ -22,4 +24,23 @@ def get_db_engine():
     url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
     logger.info(f"🔐 Using SQLAlchemy URL: mysql+pymysql://{user}:***@{host}:{port}/{database}")
 
-    return create_engine(url)
\ No newline at end of file
+    # pre_ping/recycle keep long-lived pooled connections from going stale on MySQL
+    return create_engine(url, pool_pre_ping=True, pool_recycle=3600)
+
+
+def read_frame(conn, query, params=None, dtype_backend=None) -> pd.DataFrame:
+    """Execute a query on an open connection and build a DataFrame from the fetched rows
+
+    dtype_backend ('pyarrow' or 'numpy_nullable') converts the columns after the fetch,
+    e.g. so string columns are Arrow arrays instead of Python objects.
+    """
+    result = conn.execute(query, params or {})
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    if dtype_backend:
+        df = df.convert_dtypes(dtype_backend=dtype_backend)
+    return df
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so user input is matched literally (MySQL default escape char)"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -7,10 +7,12 @@ Updated to integrate with demand_analysis module
 """
 
 import math
-import pandas as pd
+import time
+from contextlib import nullcontext
 import numpy as np
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+import streamlit as st
+from typing import Dict, NamedTuple, Optional, Tuple
+from datetime import datetime
 from sqlalchemy import text
 from ..db import get_db_engine
 from .demand_analysis import fetch_demand_stats, get_lead_time_estimate
@@ -34,6 +36,43 @@ Z_SCORE_MAP = {
     99.9: 3.09
 }
 
+# Sorted lookup arrays for nearest-level searches
+_Z_KEYS = np.array(sorted(Z_SCORE_MAP), dtype=np.float64)
+_Z_VALUES = np.array([Z_SCORE_MAP[k] for k in sorted(Z_SCORE_MAP)], dtype=np.float64)
+
+
+class SafetyStockResult(NamedTuple):
+    """Result of a single calculator call"""
+    method: str
+    safety_stock_qty: float
+    reorder_point: Optional[float]
+    formula_used: Optional[str]
+    calculation_notes: Optional[str]
+    parameters: Optional[Dict] = None
+
+    def to_dict(self) -> Dict:
+        """Dict form returned by calculate_safety_stock"""
+        result = self._asdict()
+        if self.parameters is None:
+            del result['parameters']
+        return result
+
+
+# Last formatted calculated_at stamp: (epoch seconds, ISO string), replaced as one tuple
+# so script threads never see a new time paired with an old string
+_iso_cache = (0.0, '')
+
+
+def _now_iso() -> str:
+    """Current time as ISO string, reformatted at most once per second"""
+    global _iso_cache
+    t = time.time()
+    cached_at, stamp = _iso_cache
+    if t - cached_at >= 1.0:
+        stamp = datetime.now().isoformat()
+        _iso_cache = (t, stamp)
+    return stamp
+
 
 def calculate_safety_stock(method: str, **params) -> Dict:
     """
@@ -41,18 +80,14 @@ def calculate_safety_stock(method: str, **params) -> Dict:
     
     Args:
         method: Calculation method (FIXED, DAYS_OF_SUPPLY, LEAD_TIME_BASED)
-        **params: Method-specific parameters
+        **params: Method-specific parameters (include_formula=False skips formula/notes text)
     
     Returns:
         Dict with calculation results including safety_stock_qty, reorder_point, and formula
+        (calculators return SafetyStockResult, converted here at the API boundary)
     """
-    method_map = {
-        'FIXED': calculate_fixed,
-        'DAYS_OF_SUPPLY': calculate_days_of_supply,
-        'LEAD_TIME_BASED': calculate_lead_time_based
-    }
-    
-    if method not in method_map:
+    calculator = _CALCULATORS.get(method)
+    if calculator is None:
         return {
             'method': method,
             'safety_stock_qty': 0,
@@ -61,18 +96,26 @@ def calculate_safety_stock(method: str, **params) -> Dict:
         }
     
     try:
-        result = method_map[method](**params)
-        result['calculated_at'] = datetime.now().isoformat()
+        if method == 'FIXED':
+            # Most rules are FIXED - call it directly instead of repacking **params
+            result = calculate_fixed(
+                params['safety_stock_qty'], params.get('reorder_point'),
+                include_formula=params.get('include_formula', True)
+            )
+        else:
+            result = calculator(**params)
         
         # Calculate reorder point for all methods
-        if 'reorder_point' not in result or result.get('reorder_point') is None:
-            result['reorder_point'] = calculate_reorder_point(
+        if result.reorder_point is None:
+            result = result._replace(reorder_point=calculate_reorder_point(
                 method=method,
-                safety_stock_qty=result['safety_stock_qty'],
+                safety_stock_qty=result.safety_stock_qty,
                 avg_daily_demand=params.get('avg_daily_demand', 0),
                 lead_time_days=params.get('lead_time_days', 7)
-            )
+            ))
         
+        result = result.to_dict()
+        result['calculated_at'] = _now_iso()
         return result
     except Exception as e:
         logger.error(f"Error in {method} calculation: {e}")
@@ -87,25 +130,27 @@ def calculate_safety_stock(method: str, **params) -> Dict:
 def calculate_fixed(
     safety_stock_qty: float, 
     reorder_point: Optional[float] = None,
+    include_formula: bool = True,
     **kwargs
-) -> Dict:
+) -> SafetyStockResult:
     """
     FIXED method - Manual input, no calculation
     
     Args:
         safety_stock_qty: Manually specified quantity
         reorder_point: Manually specified reorder point
+        include_formula: Fill formula_used/calculation_notes (None when False)
     
     Returns:
-        Calculation result dictionary
+        SafetyStockResult
     """
-    return {
-        'method': 'FIXED',
-        'safety_stock_qty': float(safety_stock_qty),
-        'reorder_point': float(reorder_point) if reorder_point else None,
-        'formula_used': 'Manual Input',
-        'calculation_notes': 'Safety stock and reorder point were manually specified'
-    }
+    return SafetyStockResult(
+        method='FIXED',
+        safety_stock_qty=float(safety_stock_qty),
+        reorder_point=float(reorder_point) if reorder_point else None,
+        formula_used='Manual Input' if include_formula else None,
+        calculation_notes='Safety stock and reorder point were manually specified' if include_formula else None
+    )
 
 
 def calculate_days_of_supply(
@@ -116,8 +161,9 @@ def calculate_days_of_supply(
     entity_id: int = None,
     customer_id: Optional[int] = None,
     use_delivery_view: bool = False,
+    include_formula: bool = True,
     **kwargs
-) -> Dict:
+) -> SafetyStockResult:
     """
     DAYS_OF_SUPPLY method
     Formula: 
@@ -132,9 +178,10 @@ def calculate_days_of_supply(
         entity_id: Entity ID for demand calculation
         customer_id: Customer ID for demand calculation
         use_delivery_view: Use delivery_full_view instead of stock_out tables
+        include_formula: Build formula_used/calculation_notes (None when False)
     
     Returns:
-        Calculation result dictionary
+        SafetyStockResult
     """
     # If demand not provided, fetch from appropriate source
     if avg_daily_demand == 0 and product_id and entity_id:
@@ -157,24 +204,29 @@ def calculate_days_of_supply(
             )
             avg_daily_demand = demand_stats['avg_daily_demand']
     
-    # Calculate safety stock
-    safety_stock_qty = safety_days * avg_daily_demand
+    # Same kernel as the batch path, on a single item
+    safety_stock_qty, reorder_point = calculate_days_of_supply_batch(
+        safety_days, avg_daily_demand, lead_time_days
+    )
+    safety_stock_qty, reorder_point = float(safety_stock_qty), float(reorder_point)
     
-    # Calculate reorder point
-    reorder_point = (lead_time_days * avg_daily_demand) + safety_stock_qty
+    formula = notes = None
+    if include_formula:
+        formula = f'SS = {safety_days} days × {avg_daily_demand:.2f} units/day | ROP = ({lead_time_days} × {avg_daily_demand:.2f}) + {safety_stock_qty:.2f}'
+        notes = f'Maintains {safety_days} days of average demand as buffer, reorder at {reorder_point:.0f} units'
     
-    return {
-        'method': 'DAYS_OF_SUPPLY',
-        'safety_stock_qty': round(safety_stock_qty, 2),
-        'reorder_point': round(reorder_point, 2),
-        'formula_used': f'SS = {safety_days} days × {avg_daily_demand:.2f} units/day | ROP = ({lead_time_days} × {avg_daily_demand:.2f}) + {safety_stock_qty:.2f}',
-        'calculation_notes': f'Maintains {safety_days} days of average demand as buffer, reorder at {reorder_point:.0f} units',
-        'parameters': {
+    return SafetyStockResult(
+        method='DAYS_OF_SUPPLY',
+        safety_stock_qty=safety_stock_qty,
+        reorder_point=reorder_point,
+        formula_used=formula,
+        calculation_notes=notes,
+        parameters={
             'safety_days': safety_days,
             'avg_daily_demand': round(avg_daily_demand, 2),
             'lead_time_days': lead_time_days
         }
-    }
+    )
 
 
 def calculate_lead_time_based(
@@ -186,8 +238,9 @@ def calculate_lead_time_based(
     entity_id: int = None,
     customer_id: Optional[int] = None,
     use_delivery_view: bool = False,
+    include_formula: bool = True,
     **kwargs
-) -> Dict:
+) -> SafetyStockResult:
     """
     LEAD_TIME_BASED method - Statistical safety stock
     Formula: 
@@ -203,9 +256,10 @@ def calculate_lead_time_based(
         entity_id: Entity ID for demand calculation
         customer_id: Customer ID for demand calculation
         use_delivery_view: Use delivery_full_view instead of stock_out tables
+        include_formula: Build formula_used/calculation_notes (None when False)
     
     Returns:
-        Calculation result dictionary
+        SafetyStockResult
     """
     # Get demand statistics if not provided
     if (demand_std_deviation is None or avg_daily_demand is None) and product_id and entity_id:
@@ -237,28 +291,106 @@ def calculate_lead_time_based(
     # Get Z-score for service level
     z_score = get_z_score(service_level_percent)
     
-    # Calculate safety stock: Z × √LT × σ_demand
-    safety_stock_qty = z_score * math.sqrt(lead_time_days) * demand_std_deviation
-    
-    # Calculate reorder point: (LT × ADU) + SS
-    reorder_point = (lead_time_days * avg_daily_demand) + safety_stock_qty
+    # Same kernel as the batch path, on a single item
+    safety_stock_qty, reorder_point = _lead_time_based_kernel(
+        lead_time_days, z_score, demand_std_deviation, avg_daily_demand
+    )
+    safety_stock_qty, reorder_point = float(safety_stock_qty), float(reorder_point)
     
-    formula = f'SS = {z_score:.2f} × √{lead_time_days} × {demand_std_deviation:.2f} | ROP = ({lead_time_days} × {avg_daily_demand:.2f}) + {safety_stock_qty:.2f}'
+    formula = notes = None
+    if include_formula:
+        formula = f'SS = {z_score:.2f} × √{lead_time_days} × {demand_std_deviation:.2f} | ROP = ({lead_time_days} × {avg_daily_demand:.2f}) + {safety_stock_qty:.2f}'
+        notes = f'Statistical SS for {service_level_percent}% service level over {lead_time_days} days lead time'
     
-    return {
-        'method': 'LEAD_TIME_BASED',
-        'safety_stock_qty': round(safety_stock_qty, 2),
-        'reorder_point': round(reorder_point, 2),
-        'formula_used': formula,
-        'calculation_notes': f'Statistical SS for {service_level_percent}% service level over {lead_time_days} days lead time',
-        'parameters': {
+    return SafetyStockResult(
+        method='LEAD_TIME_BASED',
+        safety_stock_qty=safety_stock_qty,
+        reorder_point=reorder_point,
+        formula_used=formula,
+        calculation_notes=notes,
+        parameters={
             'lead_time_days': lead_time_days,
             'service_level_percent': service_level_percent,
             'z_score': z_score,
             'demand_std_deviation': round(demand_std_deviation, 2),
             'avg_daily_demand': round(avg_daily_demand, 2) if avg_daily_demand else 0
         }
-    }
+    )
+
+
+# Method name -> calculator, built once for calculate_safety_stock
+_CALCULATORS = {
+    'FIXED': calculate_fixed,
+    'DAYS_OF_SUPPLY': calculate_days_of_supply,
+    'LEAD_TIME_BASED': calculate_lead_time_based
+}
+
+
+def calculate_days_of_supply_batch(
+    safety_days,
+    avg_daily_demand,
+    lead_time_days=7
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    DAYS_OF_SUPPLY method over many items at once (calculate_days_of_supply delegates here)
+    
+    Args:
+        safety_days: Days to cover per item (array-like or scalar)
+        avg_daily_demand: Average daily demand per item (array-like or scalar)
+        lead_time_days: Lead time per item (array-like or scalar)
+    
+    Returns:
+        Tuple of (safety_stock_qty, reorder_point) float64 arrays, rounded to 2 decimals
+    """
+    safety_days = np.asarray(safety_days, dtype=np.float64)
+    avg_daily_demand = np.asarray(avg_daily_demand, dtype=np.float64)
+    lead_time_days = np.asarray(lead_time_days, dtype=np.float64)
+    
+    safety_stock_qty = safety_days * avg_daily_demand
+    reorder_point = lead_time_days * avg_daily_demand + safety_stock_qty
+    
+    return np.round(safety_stock_qty, 2), np.round(reorder_point, 2)
+
+
+def calculate_lead_time_based_batch(
+    lead_time_days,
+    service_level_percent,
+    demand_std_deviation,
+    avg_daily_demand=0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    LEAD_TIME_BASED method over many items at once (shares _lead_time_based_kernel with calculate_lead_time_based)
+    
+    Args:
+        lead_time_days: Lead time per item (array-like or scalar)
+        service_level_percent: Target service level per item (array-like or scalar)
+        demand_std_deviation: Demand standard deviation per item (array-like or scalar)
+        avg_daily_demand: Average daily demand per item (array-like or scalar)
+    
+    Returns:
+        Tuple of (safety_stock_qty, reorder_point) float64 arrays, rounded to 2 decimals
+    """
+    return _lead_time_based_kernel(
+        lead_time_days, get_z_score_vec(service_level_percent), demand_std_deviation, avg_daily_demand
+    )
+
+
+def _lead_time_based_kernel(
+    lead_time_days,
+    z_scores,
+    demand_std_deviation,
+    avg_daily_demand
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Helper with the LEAD_TIME_BASED formula, shared by the scalar and batch paths"""
+    lead_time_days = np.asarray(lead_time_days, dtype=np.float64)
+    demand_std_deviation = np.asarray(demand_std_deviation, dtype=np.float64)
+    avg_daily_demand = np.asarray(avg_daily_demand, dtype=np.float64)
+    
+    # SS = Z × √LT × σ_demand; ROP = (LT × ADU) + SS
+    safety_stock_qty = z_scores * np.sqrt(lead_time_days) * demand_std_deviation
+    reorder_point = lead_time_days * avg_daily_demand + safety_stock_qty
+    
+    return np.round(safety_stock_qty, 2), np.round(reorder_point, 2)
 
 
 def calculate_reorder_point(
@@ -303,14 +435,93 @@ def get_z_score(service_level_percent: float) -> float:
     Returns:
         Z-score value
     """
-    if service_level_percent in Z_SCORE_MAP:
-        return Z_SCORE_MAP[service_level_percent]
+    z_score = Z_SCORE_MAP.get(service_level_percent)
+    if z_score is not None:
+        return z_score
     
     # Find the closest value
-    closest_level = min(Z_SCORE_MAP.keys(), 
-                       key=lambda x: abs(x - service_level_percent))
-    logger.warning(f"Service level {service_level_percent}% not in map, using {closest_level}%")
-    return Z_SCORE_MAP[closest_level]
+    idx = int(_nearest_z_index(service_level_percent))
+    logger.warning(f"Service level {service_level_percent}% not in map, using {_Z_KEYS[idx]}%")
+    return float(_Z_VALUES[idx])
+
+
+def get_z_score_vec(service_level_percent) -> np.ndarray:
+    """
+    Get Z-scores for many service levels at once (nearest map entry, as get_z_score)
+    
+    Args:
+        service_level_percent: Target service levels (array-like or scalar)
+    
+    Returns:
+        float64 array of Z-score values
+    """
+    return _Z_VALUES[_nearest_z_index(service_level_percent)]
+
+
+def _nearest_z_index(service_level_percent) -> np.ndarray:
+    """Helper to find the index of the nearest Z_SCORE_MAP level (lower level wins ties)"""
+    levels = np.asarray(service_level_percent, dtype=np.float64)
+    idx = np.clip(np.searchsorted(_Z_KEYS, levels), 1, len(_Z_KEYS) - 1)
+    return idx - ((levels - _Z_KEYS[idx - 1]) <= (_Z_KEYS[idx] - levels))
+
+
+# Daily demand from stock_out tables (existing logic), one row per day with demand;
+# day_offset is days before today (0 = today)
+_DAILY_DEMAND_SQL = """
+SELECT 
+    DATEDIFF(CURRENT_DATE(), DATE(sod.created_date)) as day_offset,
+    SUM(sodrd.stock_out_request_quantity) as daily_demand
+FROM stock_out_delivery_request_details sodrd
+JOIN stock_out_delivery sod ON sodrd.delivery_id = sod.id
+WHERE sodrd.product_id = :product_id
+AND sod.seller_company_id = :entity_id
+AND sod.created_date >= DATE_SUB(CURRENT_DATE(), INTERVAL :days_back DAY)
+AND sodrd.delete_flag = 0
+AND sod.delete_flag = 0
+{customer_filter}
+GROUP BY DATE(sod.created_date)
+"""
+
+# The same days reduced to one row of totals (used when outliers are kept); the
+# day_offset bound matches the in_window filter of the array path
+_DEMAND_TOTALS_SQL = """
+SELECT 
+    COUNT(*) as days_with_demand,
+    SUM(daily_demand) as total,
+    SUM(daily_demand * daily_demand) as total_sq,
+    MIN(daily_demand) as min_demand,
+    MAX(daily_demand) as max_demand
+FROM ({daily_sql}) daily
+WHERE day_offset BETWEEN 0 AND :days_back
+"""
+
+def _daily_demand_sql(with_customer: bool) -> str:
+    """Helper to fill in the optional customer filter of _DAILY_DEMAND_SQL"""
+    return _DAILY_DEMAND_SQL.format(
+        customer_filter="AND sod.buyer_company_id = :customer_id" if with_customer else ""
+    )
+
+
+# Statements are built once at import, keyed by whether a customer filter applies
+_DAILY_DEMAND_QUERIES = {
+    with_customer: text(_daily_demand_sql(with_customer))
+    for with_customer in (False, True)
+}
+_DEMAND_TOTALS_QUERIES = {
+    with_customer: text(_DEMAND_TOTALS_SQL.format(daily_sql=_daily_demand_sql(with_customer)))
+    for with_customer in (False, True)
+}
+
+
+# Returned when there is no demand history (or the query fails)
+_DEFAULT_DEMAND_STATS = {
+    'avg_daily_demand': 0,
+    'std_deviation': 0,
+    'max_demand': 0,
+    'min_demand': 0,
+    'coefficient_variation': 0,
+    'data_points': 0
+}
 
 
 def get_historical_demand(
@@ -318,113 +529,171 @@ def get_historical_demand(
     entity_id: int, 
     customer_id: Optional[int] = None,
     days_back: int = 90,
-    exclude_outliers: bool = True
+    exclude_outliers: bool = True,
+    conn=None
 ) -> Dict:
     """
     Analyze historical demand for a product
     (Keeping existing logic for backward compatibility)
     
+    Results are cached for a few minutes, so rules evaluated for the same
+    product/entity/customer in one run share a single query. Failed lookups
+    are not cached.
+    
     Args:
         product_id: Product ID
         entity_id: Entity ID (seller company)
         customer_id: Optional customer ID
         days_back: Number of days to analyze
         exclude_outliers: Whether to exclude statistical outliers
+        conn: Optional open connection, so batch callers can share one across products
     
     Returns:
         Dictionary with demand statistics
     """
-    default_stats = {
-        'avg_daily_demand': 0,
-        'std_deviation': 0,
-        'max_demand': 0,
-        'min_demand': 0,
-        'coefficient_variation': 0,
-        'data_points': 0
-    }
-    
     try:
-        engine = get_db_engine()
-        
-        # Query historical demand from stock_out tables (existing logic)
-        query = text("""
-        SELECT 
-            DATE(sod.created_date) as date,
-            SUM(sodrd.stock_out_request_quantity) as daily_demand
-        FROM stock_out_delivery_request_details sodrd
-        JOIN stock_out_delivery sod ON sodrd.delivery_id = sod.id
-        WHERE sodrd.product_id = :product_id
-        AND sod.seller_company_id = :entity_id
-        AND sod.created_date >= DATE_SUB(CURRENT_DATE(), INTERVAL :days_back DAY)
-        AND sodrd.delete_flag = 0
-        AND sod.delete_flag = 0
-        """ + ("""
-        AND sod.buyer_company_id = :customer_id
-        """ if customer_id else "") + """
-        GROUP BY DATE(sod.created_date)
-        ORDER BY date
-        """)
-        
-        params = {
-            'product_id': product_id,
-            'entity_id': entity_id,
-            'days_back': days_back
-        }
-        if customer_id:
-            params['customer_id'] = customer_id
-        
-        with engine.connect() as conn:
-            df = pd.read_sql(query, conn, params=params)
-        
-        if df.empty:
-            logger.warning(f"No historical demand found for product {product_id}, entity {entity_id}")
-            return default_stats
-        
-        # Create complete date range with zero-fill
-        date_range = pd.date_range(
-            start=datetime.now() - timedelta(days=days_back),
-            end=datetime.now(),
-            freq='D'
+        return _analyze_historical_demand(
+            product_id, entity_id, customer_id, days_back, exclude_outliers, _conn=conn
         )
-        
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.set_index('date')
-        df = df.reindex(date_range, fill_value=0)
-        df.reset_index(inplace=True)
-        df.columns = ['date', 'daily_demand']
-        
-        # Remove outliers using IQR method
-        if exclude_outliers and len(df) > 10:
-            Q1 = df['daily_demand'].quantile(0.25)
-            Q3 = df['daily_demand'].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = max(0, Q1 - 1.5 * IQR)
-            upper_bound = Q3 + 1.5 * IQR
+    except Exception as e:
+        logger.error(f"Error analyzing historical demand: {e}")
+        return dict(_DEFAULT_DEMAND_STATS)
+
+
+def clear_historical_demand_cache():
+    """Invalidate cached demand statistics"""
+    _analyze_historical_demand.clear()
+
+
+@st.cache_data(ttl=300, max_entries=1024, show_spinner=False)
+def _analyze_historical_demand(
+    product_id: int,
+    entity_id: int,
+    customer_id: Optional[int],
+    days_back: int,
+    exclude_outliers: bool,
+    _conn=None
+) -> Dict:
+    """Cached query + statistics behind get_historical_demand (raises on DB errors)"""
+    params = {
+        'product_id': product_id,
+        'entity_id': entity_id,
+        'days_back': days_back
+    }
+    if customer_id:
+        params['customer_id'] = customer_id
+    with_customer = bool(customer_id)
+    
+    with (nullcontext(_conn) if _conn is not None else get_db_engine().connect()) as conn:
+        if not exclude_outliers:
+            # No outlier pass needed - let MySQL reduce the daily sums to one row of totals
+            totals = conn.execute(_DEMAND_TOTALS_QUERIES[with_customer], params).mappings().one()
             
-            before_count = len(df)
-            df = df[(df['daily_demand'] >= lower_bound) & 
-                   (df['daily_demand'] <= upper_bound)]
-            after_count = len(df)
+            if not totals['days_with_demand']:
+                logger.warning(f"No historical demand found for product {product_id}, entity {entity_id}")
+                return dict(_DEFAULT_DEMAND_STATS)
             
-            if before_count > after_count:
-                logger.info(f"Removed {before_count - after_count} outliers from demand data")
+            return _demand_stats_from_totals(totals, days_back + 1)
         
-        # Calculate statistics
-        avg_demand = df['daily_demand'].mean()
-        std_dev = df['daily_demand'].std()
-        cv = (std_dev / avg_demand * 100) if avg_demand > 0 else 0
+        rows = conn.execute(_DAILY_DEMAND_QUERIES[with_customer], params).fetchall()
+    
+    if not rows:
+        logger.warning(f"No historical demand found for product {product_id}, entity {entity_id}")
+        return dict(_DEFAULT_DEMAND_STATS)
+    
+    # Zero-fill the window: one slot per day from today back to days_back, demand scattered by offset
+    offsets = np.array([row[0] for row in rows], dtype=np.int64)
+    quantities = np.array([row[1] for row in rows], dtype=np.float64)
+    in_window = (offsets >= 0) & (offsets <= days_back)
+    
+    demand = np.zeros(days_back + 1, dtype=np.float64)
+    demand[offsets[in_window]] = quantities[in_window]
+    
+    return _demand_stats(demand, exclude_outliers)
+
+
+def _demand_stats(demand: np.ndarray, exclude_outliers: bool = True) -> Dict:
+    """
+    Helper to compute demand statistics from zero-filled daily demand values
+    
+    Works on the raw ndarray: one sort, then the IQR bounds select a
+    contiguous slice of the sorted values instead of a boolean mask.
+    
+    Args:
+        demand: Daily demand values (one per day, 0 for days without demand)
+        exclude_outliers: Whether to drop values outside 1.5 × IQR
+    
+    Returns:
+        Dictionary with demand statistics
+    """
+    values = np.sort(demand)
+    
+    # Remove outliers using IQR method
+    if exclude_outliers and len(values) > 10:
+        q1, q3 = np.quantile(values, [0.25, 0.75])
+        iqr = q3 - q1
+        lower_bound = max(0.0, q1 - 1.5 * iqr)
+        upper_bound = q3 + 1.5 * iqr
         
-        return {
-            'avg_daily_demand': round(avg_demand, 2),
-            'std_deviation': round(std_dev, 2),
-            'max_demand': df['daily_demand'].max(),
-            'min_demand': df['daily_demand'].min(),
-            'coefficient_variation': round(cv, 2),
-            'data_points': len(df)
-        }
+        before_count = len(values)
+        values = values[
+            np.searchsorted(values, lower_bound, side='left'):
+            np.searchsorted(values, upper_bound, side='right')
+        ]
         
-    except Exception as e:
-        logger.error(f"Error analyzing historical demand: {e}")
-        return default_stats
+        if before_count > len(values):
+            logger.info(f"Removed {before_count - len(values)} outliers from demand data")
+    
+    # Calculate statistics (sample std, as pandas' Series.std)
+    avg_demand = float(values.mean())
+    std_dev = float(values.std(ddof=1)) if len(values) > 1 else float('nan')
+    cv = (std_dev / avg_demand * 100) if avg_demand > 0 else 0
+    
+    return {
+        'avg_daily_demand': round(avg_demand, 2),
+        'std_deviation': round(std_dev, 2),
+        'max_demand': float(values[-1]),
+        'min_demand': float(values[0]),
+        'coefficient_variation': round(cv, 2),
+        'data_points': len(values)
+    }
 
+
+def _demand_stats_from_totals(totals, n_days: int) -> Dict:
+    """
+    Helper to compute demand statistics from SQL totals over the days with demand
+    
+    Days without demand count as zeros, so n_days (not the row count) is the
+    denominator - the same numbers _demand_stats gives on the zero-filled series.
+    
+    Args:
+        totals: Row with days_with_demand, total, total_sq, min_demand, max_demand
+        n_days: Number of days in the window
+    
+    Returns:
+        Dictionary with demand statistics
+    """
+    total = float(totals['total'] or 0)
+    total_sq = float(totals['total_sq'] or 0)
+    
+    avg_demand = total / n_days
+    if n_days > 1:
+        # Sample variance from the sums; clamp tiny negative rounding error
+        std_dev = math.sqrt(max(0.0, (total_sq - n_days * avg_demand * avg_demand) / (n_days - 1)))
+    else:
+        std_dev = float('nan')
+    cv = (std_dev / avg_demand * 100) if avg_demand > 0 else 0
+    
+    # Zero-filled days take part in min/max too
+    has_zero_days = totals['days_with_demand'] < n_days
+    min_demand = float(totals['min_demand'])
+    max_demand = float(totals['max_demand'])
     
+    return {
+        'avg_daily_demand': round(avg_demand, 2),
+        'std_deviation': round(std_dev, 2),
+        'max_demand': max(max_demand, 0.0) if has_zero_days else max_demand,
+        'min_demand': min(min_demand, 0.0) if has_zero_days else min_demand,
+        'coefficient_variation': round(cv, 2),
+        'data_points': n_days
+    }
@@ -5,11 +5,13 @@ Version 2.2 - Updated to remove reorder_qty field
 """
 
 import pandas as pd
+import streamlit as st
 import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from decimal import Decimal
 from sqlalchemy import text
-from ..db import get_db_engine
+from ..db import get_db_engine, read_frame, escape_like
 from .permissions import filter_data_for_customer, get_user_role, log_action
 
 logger = logging.getLogger(__name__)
@@ -17,13 +19,127 @@ logger = logging.getLogger(__name__)
 
 # ==================== READ Operations ====================
 
+# Output column -> SQL expression for get_safety_stock_levels, in default order
+_LEVEL_COLUMNS = {
+    'id': 's.id',
+    'product_id': 's.product_id',
+    'pt_code': 'p.pt_code',
+    'product_name': 'p.name',
+    'package_size': 'p.package_size',
+    'standard_uom': 'p.uom',
+    'brand_name': 'b.brand_name',
+    
+    'entity_id': 's.entity_id',
+    'entity_name': 'e.english_name',
+    'entity_code': 'e.company_code',
+    
+    'customer_id': 's.customer_id',
+    'customer_name': 'c.english_name',
+    'customer_code': 'c.company_code',
+    
+    'safety_stock_qty': 's.safety_stock_qty',
+    'reorder_point': 's.reorder_point',
+    
+    'calculation_method': 'ssp.calculation_method',
+    'lead_time_days': 'ssp.lead_time_days',
+    'safety_days': 'ssp.safety_days',
+    'service_level_percent': 'ssp.service_level_percent',
+    'avg_daily_demand': 'ssp.avg_daily_demand',
+    'last_calculated_date': 'ssp.last_calculated_date',
+    
+    'effective_from': 's.effective_from',
+    'effective_to': 's.effective_to',
+    'is_active': 's.is_active',
+    'priority_level': 's.priority_level',
+    'business_notes': 's.business_notes',
+    
+    'rule_type': """CASE 
+            WHEN s.customer_id IS NOT NULL THEN 'Customer Specific'
+            ELSE 'General Rule'
+        END""",
+    
+    'status': """CASE 
+            WHEN CURRENT_DATE() >= s.effective_from 
+                AND (s.effective_to IS NULL OR CURRENT_DATE() <= s.effective_to)
+                AND s.is_active = 1
+            THEN 'Active'
+            WHEN CURRENT_DATE() < s.effective_from 
+            THEN 'Future'
+            WHEN s.effective_to IS NOT NULL AND CURRENT_DATE() > s.effective_to
+            THEN 'Expired'
+            ELSE 'Inactive'
+        END""",
+    
+    'created_by': 's.created_by',
+    'created_date': 's.created_date',
+    'updated_by': 's.updated_by',
+    'updated_date': 's.updated_date'
+}
+
+def _build_level_filters(
+    entity_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    product_search: Optional[str] = None,
+    status: str = 'active',
+    include_inactive: bool = False,
+    restrict_customer_id: Optional[int] = None
+) -> Tuple[str, Dict]:
+    """Helper to build the WHERE clause and params for safety stock level queries"""
+    conditions = ["s.delete_flag = 0"]
+    params = {}
+    
+    if not include_inactive and status != 'all':
+        conditions.append("s.is_active = 1")
+    
+    if entity_id:
+        conditions.append("s.entity_id = :entity_id")
+        params['entity_id'] = entity_id
+    
+    # Handle customer filter
+    if customer_id == 'general':
+        conditions.append("s.customer_id IS NULL")
+    elif customer_id:
+        conditions.append("s.customer_id = :customer_id")
+        params['customer_id'] = customer_id
+    
+    # Customer-role users only see their own rules
+    if restrict_customer_id:
+        conditions.append("s.customer_id = :restrict_customer_id")
+        params['restrict_customer_id'] = restrict_customer_id
+    
+    # Product filter - either by ID or search
+    if product_id:
+        conditions.append("s.product_id = :product_id")
+        params['product_id'] = product_id
+    elif product_search:
+        # Prefix match (no leading wildcard) so indexes on pt_code/name can be used
+        conditions.append("(p.pt_code LIKE :search OR p.name LIKE :search)")
+        params['search'] = f"{escape_like(product_search)}%"
+    
+    # Status filter
+    if status == 'active':
+        conditions.append("CURRENT_DATE() >= s.effective_from")
+        conditions.append("(s.effective_to IS NULL OR CURRENT_DATE() <= s.effective_to)")
+    elif status == 'expired':
+        conditions.append("s.effective_to IS NOT NULL AND CURRENT_DATE() > s.effective_to")
+    elif status == 'future':
+        conditions.append("CURRENT_DATE() < s.effective_from")
+    
+    return " AND ".join(conditions), params
+
+
 def get_safety_stock_levels(
     entity_id: Optional[int] = None,
     customer_id: Optional[int] = None,
     product_id: Optional[int] = None,
     product_search: Optional[str] = None,
     status: str = 'active',
-    include_inactive: bool = False
+    include_inactive: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    columns: Optional[Tuple[str, ...]] = None,
+    restrict_customer_id: Optional[int] = None
 ) -> pd.DataFrame:
     """
     Fetch safety stock levels with filters and permission filtering
@@ -32,131 +148,142 @@ def get_safety_stock_levels(
         entity_id: Filter by entity
         customer_id: Filter by customer (None for all, 'general' for NULL only)
         product_id: Filter by specific product ID
-        product_search: Search in product PT code or name
+        product_search: Prefix search on product PT code or name
         status: Filter by status (active/all/expired/future)
         include_inactive: Include inactive records
+        limit: Maximum rows to return (None for all)
+        offset: Rows to skip before returning (used with limit)
+        columns: Output columns to fetch (None for all); id and customer_id are always included
+        restrict_customer_id: Only return this customer's rules, in SQL (see get_restricted_customer_id)
     
     Returns:
         DataFrame with safety stock data (filtered by permissions)
     """
+    try:
+        df = _query_safety_stock_levels(
+            entity_id, customer_id, product_id, product_search,
+            status, include_inactive, limit, offset,
+            tuple(columns) if columns else None,
+            restrict_customer_id
+        ).copy(deep=False)  # callers may add/replace columns without touching the cached frame
+        
+        # Defensive fallback - rows are already restricted in SQL when restrict_customer_id is passed
+        df = filter_data_for_customer(df)
+        
+        logger.info(f"Fetched {len(df)} safety stock records (user: {get_user_role()})")
+        return df
+        
+    except Exception as e:
+        logger.error(f"Error fetching safety stock levels: {e}")
+        return pd.DataFrame()
+
+
+# cache_resource skips the per-hit unpickle of the frame; the public wrapper hands out shallow copies
+@st.cache_resource(ttl=60, max_entries=128, show_spinner=False)
+def _query_safety_stock_levels(
+    entity_id: Optional[int],
+    customer_id: Optional[int],
+    product_id: Optional[int],
+    product_search: Optional[str],
+    status: str,
+    include_inactive: bool,
+    limit: Optional[int],
+    offset: int,
+    columns: Optional[Tuple[str, ...]],
+    restrict_customer_id: Optional[int]
+) -> pd.DataFrame:
+    """Cached query behind get_safety_stock_levels (before permission filtering)"""
+    engine = get_db_engine()
+    
+    where_clause, params = _build_level_filters(
+        entity_id, customer_id, product_id, product_search, status, include_inactive,
+        restrict_customer_id
+    )
+    
+    limit_clause = ""
+    if limit:
+        limit_clause = "LIMIT :limit OFFSET :offset"
+        params['limit'] = limit
+        params['offset'] = offset
+    
+    if columns:
+        # id and customer_id are always needed (row actions and permission filter)
+        names = ['id', 'customer_id'] + [c for c in columns if c not in ('id', 'customer_id')]
+    else:
+        names = list(_LEVEL_COLUMNS)
+    select_clause = ",\n        ".join(f"{_LEVEL_COLUMNS[name]} as {name}" for name in names)
+    
+    # Brand and parameter joins are only needed when one of their columns is selected
+    joins = ""
+    if any(_LEVEL_COLUMNS[name].startswith('b.') for name in names):
+        joins += "\n    LEFT JOIN brands b ON p.brand_id = b.id"
+    if any(_LEVEL_COLUMNS[name].startswith('ssp.') for name in names):
+        joins += "\n    LEFT JOIN safety_stock_parameters ssp ON s.id = ssp.safety_stock_level_id"
+    
+    query = text(f"""
+    SELECT 
+        {select_clause}
+    FROM safety_stock_levels s
+    LEFT JOIN products p ON s.product_id = p.id
+    LEFT JOIN companies e ON s.entity_id = e.id
+    LEFT JOIN companies c ON s.customer_id = c.id{joins}
+    WHERE {where_clause}
+    ORDER BY s.priority_level, p.pt_code, s.id
+    {limit_clause}
+    """)
+    
+    # Arrow-backed columns go to st.dataframe without another encoding pass
+    with engine.connect() as conn:
+        return read_frame(conn, query, params, dtype_backend='pyarrow')
+
+
+@st.cache_data(ttl=60)
+def count_safety_stock_levels(
+    entity_id: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    product_search: Optional[str] = None,
+    status: str = 'active',
+    include_inactive: bool = False,
+    restrict_customer_id: Optional[int] = None
+) -> int:
+    """
+    Count safety stock levels matching the same filters as get_safety_stock_levels
+    
+    Returns:
+        Number of matching records (0 on error)
+    """
     try:
         engine = get_db_engine()
         
-        # Build WHERE conditions
-        conditions = ["s.delete_flag = 0"]
-        params = {}
-        
-        if not include_inactive and status != 'all':
-            conditions.append("s.is_active = 1")
-        
-        if entity_id:
-            conditions.append("s.entity_id = :entity_id")
-            params['entity_id'] = entity_id
-        
-        # Handle customer filter
-        if customer_id == 'general':
-            conditions.append("s.customer_id IS NULL")
-        elif customer_id:
-            conditions.append("s.customer_id = :customer_id")
-            params['customer_id'] = customer_id
-        
-        # Product filter - either by ID or search
-        if product_id:
-            conditions.append("s.product_id = :product_id")
-            params['product_id'] = product_id
-        elif product_search:
-            conditions.append("(p.pt_code LIKE :search OR p.name LIKE :search)")
-            params['search'] = f"%{product_search}%"
-        
-        # Status filter
-        if status == 'active':
-            conditions.append("CURRENT_DATE() >= s.effective_from")
-            conditions.append("(s.effective_to IS NULL OR CURRENT_DATE() <= s.effective_to)")
-        elif status == 'expired':
-            conditions.append("s.effective_to IS NOT NULL AND CURRENT_DATE() > s.effective_to")
-        elif status == 'future':
-            conditions.append("CURRENT_DATE() < s.effective_from")
-        
-        where_clause = " AND ".join(conditions)
+        where_clause, params = _build_level_filters(
+            entity_id, customer_id, product_id, product_search, status, include_inactive,
+            restrict_customer_id
+        )
+        
+        # products is only joined when the search condition references it
+        product_join = "LEFT JOIN products p ON s.product_id = p.id" if 'search' in params else ""
         
         query = text(f"""
-        SELECT 
-            s.id,
-            s.product_id,
-            p.pt_code,
-            p.name as product_name,
-            p.package_size,
-            p.uom as standard_uom,
-            b.brand_name,
-            
-            s.entity_id,
-            e.english_name as entity_name,
-            e.company_code as entity_code,
-            
-            s.customer_id,
-            c.english_name as customer_name,
-            c.company_code as customer_code,
-            
-            s.safety_stock_qty,
-            s.reorder_point,
-            
-            ssp.calculation_method,
-            ssp.lead_time_days,
-            ssp.safety_days,
-            ssp.service_level_percent,
-            ssp.avg_daily_demand,
-            ssp.last_calculated_date,
-            
-            s.effective_from,
-            s.effective_to,
-            s.is_active,
-            s.priority_level,
-            s.business_notes,
-            
-            CASE 
-                WHEN s.customer_id IS NOT NULL THEN 'Customer Specific'
-                ELSE 'General Rule'
-            END as rule_type,
-            
-            CASE 
-                WHEN CURRENT_DATE() >= s.effective_from 
-                    AND (s.effective_to IS NULL OR CURRENT_DATE() <= s.effective_to)
-                    AND s.is_active = 1
-                THEN 'Active'
-                WHEN CURRENT_DATE() < s.effective_from 
-                THEN 'Future'
-                WHEN s.effective_to IS NOT NULL AND CURRENT_DATE() > s.effective_to
-                THEN 'Expired'
-                ELSE 'Inactive'
-            END as status,
-            
-            s.created_by,
-            s.created_date,
-            s.updated_by,
-            s.updated_date
-            
+        SELECT COUNT(*)
         FROM safety_stock_levels s
-        LEFT JOIN products p ON s.product_id = p.id
-        LEFT JOIN brands b ON p.brand_id = b.id
-        LEFT JOIN companies e ON s.entity_id = e.id
-        LEFT JOIN companies c ON s.customer_id = c.id
-        LEFT JOIN safety_stock_parameters ssp ON s.id = ssp.safety_stock_level_id
+        {product_join}
         WHERE {where_clause}
-        ORDER BY s.priority_level, p.pt_code
         """)
         
         with engine.connect() as conn:
-            df = pd.read_sql(query, conn, params=params)
-        
-        # Apply permission-based filtering for customer role
-        df = filter_data_for_customer(df)
-        
-        logger.info(f"Fetched {len(df)} safety stock records (user: {get_user_role()})")
-        return df
+            return conn.execute(query, params).scalar() or 0
         
     except Exception as e:
-        logger.error(f"Error fetching safety stock levels: {e}")
-        return pd.DataFrame()
+        logger.error(f"Error counting safety stock levels: {e}")
+        return 0
+
+
+def clear_safety_stock_level_caches():
+    """Invalidate cached safety stock level queries after a write"""
+    _query_safety_stock_levels.clear()
+    count_safety_stock_levels.clear()
+    _query_review_history.clear()
 
 
 def get_safety_stock_by_id(safety_stock_id: int) -> Optional[Dict]:
@@ -199,7 +326,11 @@ def get_safety_stock_by_id(safety_stock_id: int) -> Optional[Dict]:
             result = conn.execute(query, {'id': safety_stock_id}).fetchone()
         
         if result:
-            data = dict(result._mapping)
+            # Native Python types for Decimal columns
+            data = {
+                k: float(v) if isinstance(v, Decimal) else v
+                for k, v in result._mapping.items()
+            }
             
             # Check if customer role can access this data
             role = get_user_role()
@@ -285,25 +416,26 @@ def create_safety_stock(data: Dict, created_by: str) -> Tuple[bool, str]:
         return False, str(e)
 
 
-def _insert_parameters(conn, safety_stock_id: int, data: Dict):
-    """Helper to insert calculation parameters"""
-    params_query = text("""
-    INSERT INTO safety_stock_parameters (
-        safety_stock_level_id, calculation_method,
-        lead_time_days, safety_days,
-        demand_std_deviation, avg_daily_demand,
-        service_level_percent, formula_used,
-        last_calculated_date
-    ) VALUES (
-        :safety_stock_level_id, :calculation_method,
-        :lead_time_days, :safety_days,
-        :demand_std_deviation, :avg_daily_demand,
-        :service_level_percent, :formula_used,
-        NOW()
-    )
-    """)
-    
-    conn.execute(params_query, {
+_PARAMETERS_INSERT = text("""
+INSERT INTO safety_stock_parameters (
+    safety_stock_level_id, calculation_method,
+    lead_time_days, safety_days,
+    demand_std_deviation, avg_daily_demand,
+    service_level_percent, formula_used,
+    last_calculated_date
+) VALUES (
+    :safety_stock_level_id, :calculation_method,
+    :lead_time_days, :safety_days,
+    :demand_std_deviation, :avg_daily_demand,
+    :service_level_percent, :formula_used,
+    NOW()
+)
+""")
+
+
+def _parameter_values(safety_stock_id: int, data: Dict) -> Dict:
+    """Bind values for _PARAMETERS_INSERT"""
+    return {
         'safety_stock_level_id': safety_stock_id,
         'calculation_method': data.get('calculation_method', 'FIXED'),
         'lead_time_days': data.get('lead_time_days'),
@@ -312,7 +444,12 @@ def _insert_parameters(conn, safety_stock_id: int, data: Dict):
         'avg_daily_demand': data.get('avg_daily_demand'),
         'service_level_percent': data.get('service_level_percent'),
         'formula_used': data.get('formula_used')
-    })
+    }
+
+
+def _insert_parameters(conn, safety_stock_id: int, data: Dict):
+    """Helper to insert calculation parameters"""
+    conn.execute(_PARAMETERS_INSERT, _parameter_values(safety_stock_id, data))
 
 
 # ==================== UPDATE Operations ====================
@@ -464,6 +601,41 @@ def delete_safety_stock(safety_stock_id: int, deleted_by: str) -> Tuple[bool, st
 
 # ==================== BULK Operations ====================
 
+_BULK_LEVEL_INSERT = text("""
+INSERT INTO safety_stock_levels (
+    product_id, entity_id, customer_id,
+    safety_stock_qty, reorder_point,
+    effective_from, effective_to, is_active,
+    priority_level, business_notes,
+    created_by, updated_by
+) VALUES (
+    :product_id, :entity_id, :customer_id,
+    :safety_stock_qty, :reorder_point,
+    :effective_from, :effective_to, :is_active,
+    :priority_level, :business_notes,
+    :created_by, :updated_by
+)
+""")
+
+
+def _bulk_level_values(data: Dict, created_by: str) -> Dict:
+    """Bind values for _BULK_LEVEL_INSERT"""
+    return {
+        'product_id': data['product_id'],
+        'entity_id': data['entity_id'],
+        'customer_id': data.get('customer_id'),
+        'safety_stock_qty': data['safety_stock_qty'],
+        'reorder_point': data.get('reorder_point'),
+        'effective_from': data.get('effective_from', datetime.now().date()),
+        'effective_to': data.get('effective_to'),
+        'is_active': data.get('is_active', 1),
+        'priority_level': data.get('priority_level', 100),
+        'business_notes': data.get('business_notes'),
+        'created_by': created_by,
+        'updated_by': created_by
+    }
+
+
 def bulk_create_safety_stock(
     data_list: List[Dict], 
     created_by: str
@@ -471,6 +643,10 @@ def bulk_create_safety_stock(
     """
     Bulk create safety stock records
     
+    Rows without calculation parameters go in one executemany; rows with
+    parameters are inserted one at a time so their lastrowid can key the
+    parameter insert. Failed rows are reported per row as before.
+    
     Args:
         data_list: List of safety stock data dictionaries
         created_by: Username creating the records
@@ -483,62 +659,60 @@ def bulk_create_safety_stock(
     if not data_list:
         return False, "No data to import", results
     
+    # Blank Excel cells arrive as NaN, which the driver rejects and which reads as a set calculation_method
+    data_list = [
+        {key: (None if pd.isna(value) else value) for key, value in data.items()}
+        for data in data_list
+    ]
+    
+    row_errors = {}
+    
+    def record_error(idx: int, e: Exception):
+        results['failed'] += 1
+        row_errors[idx] = f"Row {idx}: {str(e)}"
+        logger.error(row_errors[idx])
+    
     try:
         engine = get_db_engine()
         
+        fixed_rows = [
+            (idx, _bulk_level_values(data, created_by))
+            for idx, data in enumerate(data_list, 1)
+            if not data.get('calculation_method')
+        ]
+        
         with engine.begin() as conn:
+            if fixed_rows:
+                try:
+                    # The driver may split a large executemany into several INSERTs; the
+                    # savepoint undoes the chunks already written if a later one fails
+                    with conn.begin_nested():
+                        conn.execute(_BULK_LEVEL_INSERT, [values for _, values in fixed_rows])
+                    results['created'] += len(fixed_rows)
+                except Exception:
+                    # Nothing from the batch was kept - retry row by row to find the bad rows
+                    for idx, values in fixed_rows:
+                        try:
+                            conn.execute(_BULK_LEVEL_INSERT, values)
+                            results['created'] += 1
+                        except Exception as e:
+                            record_error(idx, e)
+            
             for idx, data in enumerate(data_list, 1):
+                if not data.get('calculation_method'):
+                    continue
                 try:
-                    # Prepare data with defaults - removed reorder_qty
-                    insert_data = {
-                        'product_id': data['product_id'],
-                        'entity_id': data['entity_id'],
-                        'customer_id': data.get('customer_id'),
-                        'safety_stock_qty': data['safety_stock_qty'],
-                        'reorder_point': data.get('reorder_point'),
-                        'effective_from': data.get('effective_from', datetime.now().date()),
-                        'effective_to': data.get('effective_to'),
-                        'is_active': data.get('is_active', 1),
-                        'priority_level': data.get('priority_level', 100),
-                        'business_notes': data.get('business_notes'),
-                        'created_by': created_by,
-                        'updated_by': created_by
-                    }
-                    
-                    insert_query = text("""
-                    INSERT INTO safety_stock_levels (
-                        product_id, entity_id, customer_id,
-                        safety_stock_qty, reorder_point,
-                        effective_from, effective_to, is_active,
-                        priority_level, business_notes,
-                        created_by, updated_by
-                    ) VALUES (
-                        :product_id, :entity_id, :customer_id,
-                        :safety_stock_qty, :reorder_point,
-                        :effective_from, :effective_to, :is_active,
-                        :priority_level, :business_notes,
-                        :created_by, :updated_by
-                    )
-                    """)
-                    
-                    result = conn.execute(insert_query, insert_data)
-                    
-                    # Add calculation parameters if provided
-                    if data.get('calculation_method'):
-                        safety_stock_id = result.lastrowid
-                        _insert_parameters(conn, safety_stock_id, data)
-                    
+                    # Savepoint so a failed parameter insert does not leave its level row behind
+                    with conn.begin_nested():
+                        result = conn.execute(_BULK_LEVEL_INSERT, _bulk_level_values(data, created_by))
+                        _insert_parameters(conn, result.lastrowid, data)
                     results['created'] += 1
-                    
                 except Exception as e:
-                    results['failed'] += 1
-                    error_msg = f"Row {idx}: {str(e)}"
-                    results['errors'].append(error_msg)
-                    logger.error(error_msg)
-                    
-                    if len(results['errors']) >= 50:
-                        results['errors'].append("... additional errors truncated")
-                        break
+                    record_error(idx, e)
+        
+        results['errors'] = [row_errors[idx] for idx in sorted(row_errors)[:50]]
+        if len(row_errors) > 50:
+            results['errors'].append("... additional errors truncated")
         
         if results['created'] > 0:
             # Log the action
@@ -575,33 +749,8 @@ def create_safety_stock_review(
     try:
         engine = get_db_engine()
         
-        insert_query = text("""
-        INSERT INTO safety_stock_reviews (
-            safety_stock_level_id, review_date, review_type,
-            old_safety_stock_qty, new_safety_stock_qty,
-            action_taken, action_reason, review_notes,
-            reviewed_by, approved_by
-        ) VALUES (
-            :safety_stock_level_id, :review_date, :review_type,
-            :old_safety_stock_qty, :new_safety_stock_qty,
-            :action_taken, :action_reason, :review_notes,
-            :reviewed_by, :approved_by
-        )
-        """)
-        
         with engine.begin() as conn:
-            conn.execute(insert_query, {
-                'safety_stock_level_id': safety_stock_id,
-                'review_date': review_data.get('review_date', datetime.now().date()),
-                'review_type': review_data.get('review_type', 'PERIODIC'),
-                'old_safety_stock_qty': review_data.get('old_safety_stock_qty'),
-                'new_safety_stock_qty': review_data.get('new_safety_stock_qty'),
-                'action_taken': review_data.get('action_taken'),
-                'action_reason': review_data.get('action_reason'),
-                'review_notes': review_data.get('review_notes'),
-                'reviewed_by': reviewed_by,
-                'approved_by': review_data.get('approved_by')
-            })
+            _insert_review(conn, safety_stock_id, review_data, reviewed_by)
         
         # Log the action
         action_desc = f"Reviewed safety stock ID {safety_stock_id}"
@@ -617,43 +766,136 @@ def create_safety_stock_review(
         return False, str(e)
 
 
-def get_review_history(safety_stock_id: int) -> pd.DataFrame:
+def submit_safety_stock_review(
+    safety_stock_id: int,
+    review_data: Dict,
+    reviewed_by: str
+) -> Tuple[bool, str]:
     """
-    Get review history for a safety stock record
+    Record a review and apply its new quantity in a single transaction
     
     Args:
-        safety_stock_id: Safety stock level ID
+        safety_stock_id: ID of safety stock level being reviewed
+        review_data: Review data dictionary (old/new quantities included)
+        reviewed_by: Username conducting the review
     
     Returns:
-        DataFrame with review history
+        Tuple of (success: bool, message: str)
     """
     try:
         engine = get_db_engine()
         
-        query = text("""
-        SELECT 
-            review_date,
-            review_type,
-            old_safety_stock_qty,
-            new_safety_stock_qty,
-            change_percentage,
-            action_taken,
-            action_reason,
-            review_notes,
-            reviewed_by,
-            approved_by,
-            created_date
-        FROM safety_stock_reviews
-        WHERE safety_stock_level_id = :id
-        ORDER BY review_date DESC
-        """)
+        old_qty = review_data.get('old_safety_stock_qty')
+        new_qty = review_data.get('new_safety_stock_qty')
         
-        with engine.connect() as conn:
-            df = pd.read_sql(query, conn, params={'id': safety_stock_id})
+        with engine.begin() as conn:
+            _insert_review(conn, safety_stock_id, review_data, reviewed_by)
+            
+            # Only touch the level when the quantity actually changed
+            if new_qty is not None and new_qty != old_qty:
+                update_query = text("""
+                UPDATE safety_stock_levels 
+                SET safety_stock_qty = :safety_stock_qty,
+                    updated_by = :updated_by,
+                    updated_date = NOW()
+                WHERE id = :id AND delete_flag = 0
+                """)
+                
+                result = conn.execute(update_query, {
+                    'id': safety_stock_id,
+                    'safety_stock_qty': new_qty,
+                    'updated_by': reviewed_by
+                })
+                
+                if result.rowcount == 0:
+                    # Raising rolls back the review insert as well
+                    raise ValueError("Record not found or already deleted")
         
-        return df
+        # Log the action
+        action_desc = f"Reviewed safety stock ID {safety_stock_id}"
+        if review_data.get('approved_by'):
+            action_desc += " (approved)"
+        log_action('REVIEW', action_desc)
+        
+        logger.info(f"Submitted review for safety stock ID: {safety_stock_id} by {reviewed_by}")
+        return True, "Review submitted successfully"
+        
+    except Exception as e:
+        logger.error(f"Error submitting review by {reviewed_by}: {e}")
+        return False, str(e)
+
+
+def _insert_review(conn, safety_stock_id: int, review_data: Dict, reviewed_by: str):
+    """Helper to insert a review row"""
+    insert_query = text("""
+    INSERT INTO safety_stock_reviews (
+        safety_stock_level_id, review_date, review_type,
+        old_safety_stock_qty, new_safety_stock_qty,
+        action_taken, action_reason, review_notes,
+        reviewed_by, approved_by
+    ) VALUES (
+        :safety_stock_level_id, :review_date, :review_type,
+        :old_safety_stock_qty, :new_safety_stock_qty,
+        :action_taken, :action_reason, :review_notes,
+        :reviewed_by, :approved_by
+    )
+    """)
+    
+    conn.execute(insert_query, {
+        'safety_stock_level_id': safety_stock_id,
+        'review_date': review_data.get('review_date', datetime.now().date()),
+        'review_type': review_data.get('review_type', 'PERIODIC'),
+        'old_safety_stock_qty': review_data.get('old_safety_stock_qty'),
+        'new_safety_stock_qty': review_data.get('new_safety_stock_qty'),
+        'action_taken': review_data.get('action_taken'),
+        'action_reason': review_data.get('action_reason'),
+        'review_notes': review_data.get('review_notes'),
+        'reviewed_by': reviewed_by,
+        'approved_by': review_data.get('approved_by')
+    })
+
+
+def get_review_history(safety_stock_id: int) -> pd.DataFrame:
+    """
+    Get review history for a safety stock record
+    
+    Args:
+        safety_stock_id: Safety stock level ID
+    
+    Returns:
+        DataFrame with review history
+    """
+    try:
+        return _query_review_history(int(safety_stock_id))
         
     except Exception as e:
         logger.error(f"Error fetching review history: {e}")
         return pd.DataFrame()
 
+
+@st.cache_data(ttl=120, max_entries=256, show_spinner=False)
+def _query_review_history(safety_stock_id: int) -> pd.DataFrame:
+    """Cached query behind get_review_history"""
+    engine = get_db_engine()
+    
+    query = text("""
+    SELECT 
+        review_date,
+        review_type,
+        old_safety_stock_qty,
+        new_safety_stock_qty,
+        change_percentage,
+        action_taken,
+        action_reason,
+        review_notes,
+        reviewed_by,
+        approved_by,
+        created_date
+    FROM safety_stock_reviews
+    WHERE safety_stock_level_id = :id
+    ORDER BY review_date DESC
+    """)
+    
+    with engine.connect() as conn:
+        return read_frame(conn, query, {'id': safety_stock_id})
+
@@ -104,23 +104,7 @@ def fetch_demand_stats(
             result = conn.execute(query, params).fetchone()
         
         if result:
-            stats = dict(result._mapping)
-            
-            # Round values for display
-            stats['avg_daily_demand'] = round(float(stats['avg_daily_demand']), 2)
-            stats['demand_std_dev'] = round(float(stats['demand_std_dev']), 2)
-            stats['cv_percent'] = round(float(stats['cv_percent']), 1)
-            stats['data_points'] = int(stats['data_points'])
-            
-            # Add metadata
-            stats['fetch_date'] = datetime.now().strftime('%Y-%m-%d %H:%M')
-            stats['days_analyzed'] = days_back
-            stats['customer_specific'] = customer_id is not None
-            
-            # Add method suggestion based on CV%
-            stats['suggested_method'] = suggest_calculation_method(stats['cv_percent'], stats['data_points'])
-            
-            return stats
+            return _build_demand_stats(dict(result._mapping), days_back, customer_id)
         else:
             return get_empty_stats()
             
@@ -129,6 +113,25 @@ def fetch_demand_stats(
         return get_empty_stats()
 
 
+def _build_demand_stats(stats: Dict, days_back: int, customer_id: Optional[int]) -> Dict:
+    """Helper to round raw demand aggregates and add metadata/method suggestion"""
+    # Round values for display
+    stats['avg_daily_demand'] = round(float(stats['avg_daily_demand']), 2)
+    stats['demand_std_dev'] = round(float(stats['demand_std_dev']), 2)
+    stats['cv_percent'] = round(float(stats['cv_percent']), 1)
+    stats['data_points'] = int(stats['data_points'])
+    
+    # Add metadata
+    stats['fetch_date'] = datetime.now().strftime('%Y-%m-%d %H:%M')
+    stats['days_analyzed'] = days_back
+    stats['customer_specific'] = customer_id is not None
+    
+    # Add method suggestion based on CV%
+    stats['suggested_method'] = suggest_calculation_method(stats['cv_percent'], stats['data_points'])
+    
+    return stats
+
+
 def get_empty_stats() -> Dict:
     """Return empty statistics structure"""
     return {
@@ -145,6 +148,15 @@ def get_empty_stats() -> Dict:
     }
 
 
+# Suggested method by [data bucket][variability bucket]
+# data bucket: <10, 10-29, >=30 points; variability bucket: CV% < 20, >= 20
+_SUGGESTED_METHODS = (
+    ('FIXED', 'FIXED'),                          # Insufficient data
+    ('DAYS_OF_SUPPLY', 'DAYS_OF_SUPPLY'),        # Some data but not enough for statistical
+    ('DAYS_OF_SUPPLY', 'LEAD_TIME_BASED'),       # Enough data - statistical if variable
+)
+
+
 def suggest_calculation_method(cv_percent: float, data_points: int) -> str:
     """
     Suggest best calculation method based on demand variability
@@ -156,21 +168,8 @@ def suggest_calculation_method(cv_percent: float, data_points: int) -> str:
     Returns:
         Suggested method: 'FIXED', 'DAYS_OF_SUPPLY', or 'LEAD_TIME_BASED'
     """
-    # Insufficient data
-    if data_points < 10:
-        return 'FIXED'
-    
-    # Low variability - simple method works well
-    if cv_percent < 20:
-        return 'DAYS_OF_SUPPLY'
-    
-    # Moderate to high variability - use statistical method
-    elif cv_percent >= 20 and data_points >= 30:
-        return 'LEAD_TIME_BASED'
-    
-    # Some data but not enough for statistical
-    else:
-        return 'DAYS_OF_SUPPLY'
+    # int() so NumPy scalars index like Python ones (np.bool_ + np.bool_ is a logical OR)
+    return _SUGGESTED_METHODS[int(data_points >= 10) + int(data_points >= 30)][int(cv_percent >= 20)]
 
 
 def get_lead_time_estimate(
@@ -217,18 +216,27 @@ def get_lead_time_estimate(
             result = conn.execute(query, params).fetchone()
         
         if result and result.avg_lead_time_days:
-            return {
-                'avg_lead_time_days': round(float(result.avg_lead_time_days), 0),
-                'min_lead_time_days': int(result.min_lead_time_days) if result.min_lead_time_days else 0,
-                'max_lead_time_days': int(result.max_lead_time_days) if result.max_lead_time_days else 0,
-                'sample_size': int(result.sample_size) if result.sample_size else 0,
-                'is_estimate': True,
-                'calculation_basis': 'OC to Delivery'
-            }
+            return _build_lead_time_info(result)
     except Exception as e:
         logger.error(f"Error estimating lead time: {e}")
     
-    # Default fallback
+    return _default_lead_time_info()
+
+
+def _build_lead_time_info(result) -> Dict:
+    """Helper to convert a lead time aggregate row into the estimate dictionary"""
+    return {
+        'avg_lead_time_days': round(float(result.avg_lead_time_days), 0),
+        'min_lead_time_days': int(result.min_lead_time_days) if result.min_lead_time_days else 0,
+        'max_lead_time_days': int(result.max_lead_time_days) if result.max_lead_time_days else 0,
+        'sample_size': int(result.sample_size) if result.sample_size else 0,
+        'is_estimate': True,
+        'calculation_basis': 'OC to Delivery'
+    }
+
+
+def _default_lead_time_info() -> Dict:
+    """Default lead time when no historical data is available"""
     return {
         'avg_lead_time_days': 7,
         'min_lead_time_days': 0,
@@ -239,6 +247,141 @@ def get_lead_time_estimate(
     }
 
 
+def fetch_demand_and_lead_time(
+    product_id: int,
+    entity_id: int,
+    customer_id: Optional[int] = None,
+    days_back: int = 90,
+    exclude_pending: bool = True
+) -> Tuple[Dict, Dict]:
+    """
+    Fetch demand statistics and lead time estimate in one query
+    
+    Both aggregates share one scan of delivery_full_view for the product/entity,
+    instead of fetch_demand_stats + get_lead_time_estimate each reading it.
+    
+    Args:
+        product_id: Product ID
+        entity_id: Legal entity ID
+        customer_id: Optional customer ID (demand only - lead time is per product/entity)
+        days_back: Number of days of demand to analyze
+        exclude_pending: Exclude deliveries with PENDING status from demand
+        
+    Returns:
+        Tuple of (demand stats dict, lead time dict) in the same shapes as the separate functions
+    """
+    try:
+        engine = get_db_engine()
+        
+        # Demand-only conditions, applied on top of the shared product/entity rowset
+        demand_conditions = [
+            "sto_etd_date >= DATE_SUB(CURRENT_DATE(), INTERVAL :days_back DAY)",
+            "sto_etd_date IS NOT NULL",
+            "stock_out_request_quantity > 0"
+        ]
+        
+        if customer_id:
+            demand_conditions.append("customer_code = (SELECT company_code FROM companies WHERE id = :customer_id)")
+        
+        if exclude_pending:
+            demand_conditions.append("shipment_status != 'PENDING'")
+        
+        demand_where = " AND ".join(demand_conditions)
+        
+        query = text(f"""
+        WITH base AS (
+            SELECT 
+                sto_etd_date,
+                stock_out_request_quantity,
+                customer_code,
+                shipment_status,
+                delivered_date,
+                oc_date
+            FROM delivery_full_view
+            WHERE product_id = :product_id
+                AND legal_entity_code = (SELECT company_code FROM companies WHERE id = :entity_id)
+        ),
+        daily_demand AS (
+            SELECT 
+                DATE(sto_etd_date) as demand_date,
+                SUM(stock_out_request_quantity) as daily_quantity
+            FROM base
+            WHERE {demand_where}
+            GROUP BY DATE(sto_etd_date)
+        ),
+        demand_stats AS (
+            SELECT 
+                AVG(daily_quantity) as avg_daily_demand,
+                STDDEV(daily_quantity) as demand_std_dev,
+                MAX(daily_quantity) as max_daily_demand,
+                MIN(daily_quantity) as min_daily_demand,
+                COUNT(*) as data_points
+            FROM daily_demand
+        ),
+        lead_times AS (
+            SELECT 
+                AVG(DATEDIFF(delivered_date, oc_date)) as avg_lead_time_days,
+                MIN(DATEDIFF(delivered_date, oc_date)) as min_lead_time_days,
+                MAX(DATEDIFF(delivered_date, oc_date)) as max_lead_time_days,
+                COUNT(*) as sample_size
+            FROM base
+            WHERE shipment_status = 'DELIVERED'
+                AND delivered_date IS NOT NULL
+                AND oc_date IS NOT NULL
+                AND DATEDIFF(delivered_date, oc_date) > 0
+                AND DATEDIFF(delivered_date, oc_date) < 365
+        )
+        SELECT 
+            COALESCE(d.avg_daily_demand, 0) as avg_daily_demand,
+            COALESCE(d.demand_std_dev, 0) as demand_std_dev,
+            COALESCE(d.max_daily_demand, 0) as max_daily_demand,
+            COALESCE(d.min_daily_demand, 0) as min_daily_demand,
+            COALESCE(d.data_points, 0) as data_points,
+            CASE 
+                WHEN d.avg_daily_demand > 0 
+                THEN (d.demand_std_dev / d.avg_daily_demand * 100)
+                ELSE 0
+            END as cv_percent,
+            lt.avg_lead_time_days,
+            lt.min_lead_time_days,
+            lt.max_lead_time_days,
+            lt.sample_size
+        FROM demand_stats d
+        CROSS JOIN lead_times lt
+        """)
+        
+        params = {
+            'product_id': product_id,
+            'entity_id': entity_id,
+            'days_back': days_back
+        }
+        if customer_id:
+            params['customer_id'] = customer_id
+        
+        with engine.connect() as conn:
+            result = conn.execute(query, params).fetchone()
+        
+        if not result:
+            return get_empty_stats(), _default_lead_time_info()
+        
+        row = result._mapping
+        stats = _build_demand_stats(
+            {key: row[key] for key in (
+                'avg_daily_demand', 'demand_std_dev', 'max_daily_demand',
+                'min_daily_demand', 'data_points', 'cv_percent'
+            )},
+            days_back,
+            customer_id
+        )
+        lead_time_info = _build_lead_time_info(result) if result.avg_lead_time_days else _default_lead_time_info()
+        
+        return stats, lead_time_info
+        
+    except Exception as e:
+        logger.error(f"Error fetching demand and lead time: {e}")
+        return get_empty_stats(), _default_lead_time_info()
+
+
 def format_demand_summary(stats: Dict) -> str:
     """
     Format demand statistics for display (simplified version)
@@ -9,6 +9,7 @@ import io
 from datetime import datetime
 from typing import Optional
 import logging
+import xlsxwriter
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
@@ -30,6 +31,32 @@ THIN_BORDER = Border(
 )
 ALT_ROW_FILL = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
 
+# xlsxwriter equivalents used by the streamed exports
+XLSX_OPTIONS = {
+    'constant_memory': True,
+    'strings_to_urls': False,
+    'default_date_format': 'yyyy-mm-dd'
+}
+XLSX_HEADER_FORMAT = {
+    'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#366092',
+    'align': 'center', 'valign': 'vcenter', 'text_wrap': True, 'border': 1
+}
+XLSX_CELL_FORMAT = {'border': 1}
+XLSX_ALT_ROW_FORMAT = {'bg_color': '#F2F2F2'}
+XLSX_NEGATIVE_FORMAT = {'font_color': '#C00000'}
+
+# First cell of the upload template's description row - lets the upload skip it with one lookup
+TEMPLATE_DESCRIPTION_MARKER = 'Required: Product ID from system'
+
+# Upload columns consumed by validation/import; anything else in the sheet is not read
+UPLOAD_COLUMNS = frozenset([
+    'product_id', 'entity_id', 'customer_id',
+    'safety_stock_qty', 'reorder_point',
+    'calculation_method', 'lead_time_days', 'safety_days',
+    'service_level_percent', 'demand_std_deviation', 'avg_daily_demand',
+    'effective_from', 'effective_to', 'priority_level', 'business_notes'
+])
+
 
 def export_to_excel(
     df: pd.DataFrame,
@@ -50,7 +77,7 @@ def export_to_excel(
     output = io.BytesIO()
     
     try:
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        with xlsxwriter.Workbook(output, XLSX_OPTIONS) as workbook:
             # Main data columns - removed reorder_qty
             main_columns = [
                 'pt_code', 'product_name', 'brand_name',
@@ -81,18 +108,13 @@ def export_to_excel(
             main_df['customer_name'] = main_df['customer_name'].fillna('General Rule')
             
             # Write main sheet
-            main_df.to_excel(writer, sheet_name='Safety Stock Levels', index=False)
+            _write_xlsx_sheet(workbook, 'Safety Stock Levels', main_df)
             
             # Add parameters sheet if requested
             if include_parameters:
                 param_df = _prepare_parameters_sheet(df)
                 if not param_df.empty:
-                    param_df.to_excel(writer, sheet_name='Calculation Parameters', index=False)
-            
-            # Format all sheets
-            workbook = writer.book
-            for sheet_name in workbook.sheetnames:
-                _format_excel_sheet(workbook[sheet_name])
+                    _write_xlsx_sheet(workbook, 'Calculation Parameters', param_df)
         
         output.seek(0)
         
@@ -170,6 +192,45 @@ def _format_excel_sheet(worksheet, freeze_row: int = 2):
     worksheet.freeze_panes = f'A{freeze_row}'
 
 
+def _write_xlsx_sheet(workbook, sheet_name: str, df: pd.DataFrame, freeze_row: int = 2):
+    """
+    Write a DataFrame to a new worksheet row by row with the standard formatting
+    
+    Rows are written in order so the workbook can run in constant_memory mode.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format(XLSX_HEADER_FORMAT)
+    cell_format = workbook.add_format(XLSX_CELL_FORMAT)
+    alt_row_format = workbook.add_format(XLSX_ALT_ROW_FORMAT)
+    
+    # Column widths from the longest header/value, with min/max limits
+    for col_num, col in enumerate(df.columns):
+        max_length = len(str(col))
+        # All-empty columns (e.g. effective_to on open-ended rules) have no lengths to take a max of
+        lengths = df[col].dropna().astype(str).str.len()
+        if len(lengths):
+            max_length = max(max_length, int(lengths.max()))
+        worksheet.set_column(col_num, col_num, min(max(max_length + 2, 10), 50))
+    
+    worksheet.freeze_panes(freeze_row - 1, 0)
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+    
+    # NaN/NaT can't be written to a cell - send them as blanks
+    values = df.astype(object).where(df.notna(), None).values.tolist()
+    for row_num, row in enumerate(values, 1):
+        worksheet.write_row(row_num, 0, row, cell_format)
+    
+    # Alternate row coloring (skip header) as one rule instead of a format per row
+    if values and len(df.columns):
+        worksheet.conditional_format(1, 0, len(values), len(df.columns) - 1, {
+            'type': 'formula',
+            'criteria': '=MOD(ROW(),2)=0',
+            'format': alt_row_format
+        })
+    
+    return worksheet
+
+
 def create_upload_template(include_sample_data: bool = False) -> io.BytesIO:
     """
     Create Excel template for bulk upload
@@ -185,7 +246,7 @@ def create_upload_template(include_sample_data: bool = False) -> io.BytesIO:
     try:
         # Template columns with descriptions - removed reorder_qty
         template_data = {
-            'product_id': ['Required: Product ID from system'],
+            'product_id': [TEMPLATE_DESCRIPTION_MARKER],
             'entity_id': ['Required: Entity/Company ID'],
             'customer_id': ['Optional: Customer ID (leave blank for general rule)'],
             'safety_stock_qty': ['Required: Safety Stock Quantity (>= 0)'],
@@ -298,6 +359,37 @@ def create_upload_template(include_sample_data: bool = False) -> io.BytesIO:
         raise
 
 
+def read_upload_file(uploaded_file) -> pd.DataFrame:
+    """
+    Read a bulk upload workbook, keeping only UPLOAD_COLUMNS
+    
+    Uses the Rust-backed calamine engine when python-calamine is installed and
+    falls back to pandas' default engine otherwise.
+    
+    Args:
+        uploaded_file: Path or file-like object (e.g. Streamlit UploadedFile)
+    
+    Returns:
+        DataFrame without the template description row
+    """
+    def usecols(col):
+        return col in UPLOAD_COLUMNS
+    
+    try:
+        df = pd.read_excel(uploaded_file, engine='calamine', usecols=usecols)
+    except (ImportError, ValueError):
+        # python-calamine missing, or a pandas release without the calamine engine
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        df = pd.read_excel(uploaded_file, usecols=usecols)
+    
+    # Skip the template's description row (checked by its first cell only)
+    if not df.empty and str(df.iat[0, 0]) == TEMPLATE_DESCRIPTION_MARKER:
+        df = df.iloc[1:].reset_index(drop=True)
+    
+    return df
+
+
 def _create_instructions() -> list:
     """Create instructions for template"""
     return [
@@ -369,19 +461,23 @@ def generate_review_report(
         recent_df = _get_recent_reviews(engine, review_period_days, entity_id)
         
         # Write to Excel
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
+        with xlsxwriter.Workbook(output, XLSX_OPTIONS) as workbook:
+            _write_xlsx_sheet(workbook, 'Summary', summary_df)
             
             if not pending_df.empty:
-                pending_df.to_excel(writer, sheet_name='Pending Reviews', index=False)
+                _write_xlsx_sheet(workbook, 'Pending Reviews', pending_df)
             
             if not recent_df.empty:
-                recent_df.to_excel(writer, sheet_name='Recent Reviews', index=False)
-            
-            # Format sheets
-            workbook = writer.book
-            for sheet_name in workbook.sheetnames:
-                _format_excel_sheet(workbook[sheet_name])
+                recent_sheet = _write_xlsx_sheet(workbook, 'Recent Reviews', recent_df)
+                
+                # Highlight decreases
+                change_col = recent_df.columns.get_loc('Change %')
+                recent_sheet.conditional_format(1, change_col, len(recent_df), change_col, {
+                    'type': 'cell',
+                    'criteria': '<',
+                    'value': 0,
+                    'format': workbook.add_format(XLSX_NEGATIVE_FORMAT)
+                })
         
         output.seek(0)
         
@@ -7,6 +7,7 @@ Simple permission system based on user roles
 import streamlit as st
 import pandas as pd
 import logging
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +125,18 @@ def has_permission(permission: str) -> bool:
     return permissions.get(permission, False)
 
 
+def get_restricted_customer_id() -> Optional[int]:
+    """
+    Get the customer ID that data queries must be restricted to
+    
+    Returns:
+        Session customer ID for the customer role, None for every other role
+    """
+    if get_user_role() == 'customer':
+        return st.session_state.get('customer_id')
+    return None
+
+
 def filter_data_for_customer(df: pd.DataFrame, customer_col: str = 'customer_id') -> pd.DataFrame:
     """
     Filter dataframe for customer role (only their data)
@@ -143,7 +156,8 @@ def filter_data_for_customer(df: pd.DataFrame, customer_col: str = 'customer_id'
         customer_id = st.session_state.get('customer_id')
         if customer_id:
             # Customer can only see their own data
-            df = df[df[customer_col] == customer_id]
+            # Nullable (Arrow) columns compare NULL to NA - treat that as no match
+            df = df[(df[customer_col] == customer_id).fillna(False)]
             logger.info(f"Filtered data for customer ID: {customer_id}")
         else:
             # No customer ID found, return empty
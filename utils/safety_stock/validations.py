@@ -4,11 +4,12 @@ Validation functions for Safety Stock Management
 Version 3.0 - Updated for merged calculation/stock levels with reorder point validation
 """
 
+import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, date
-from sqlalchemy import text
-from ..db import get_db_engine
+from sqlalchemy import text, bindparam
+from ..db import get_db_engine, read_frame
 import logging
 
 logger = logging.getLogger(__name__)
@@ -296,29 +297,27 @@ def validate_bulk_data(df: pd.DataFrame) -> Tuple[bool, pd.DataFrame, List[str]]
         errors.append(f"Missing required columns: {', '.join(missing_columns)}")
         return False, df, errors
     
-    # Clean and validate each row
-    row_errors = []
-    rows_to_drop = []
+    # Column checks over the whole frame, then one DB lookup for the rows that pass them
+    codes = _row_error_codes(validated_df)
+    conflicts = _find_existing_conflicts(validated_df, codes == 0)
     
-    for idx, row in validated_df.iterrows():
-        row_dict = row.to_dict()
-        
-        # Remove NaN values
-        row_dict = {k: v for k, v in row_dict.items() if pd.notna(v)}
-        
-        # Validate row
-        is_valid, row_error_list = validate_safety_stock_data(row_dict, mode='create')
-        
-        if not is_valid:
-            row_num = idx + 2  # +1 for 0-index, +1 for header row
-            row_errors.append(f"Row {row_num}: {'; '.join(row_error_list)}")
-            rows_to_drop.append(idx)
+    bad = codes != 0
+    bad[list(conflicts)] = True
+    bad_positions = np.flatnonzero(bad)
     
-    # Add row errors to main error list
-    if row_errors:
-        errors.extend(row_errors[:20])  # Limit to first 20 errors
-        if len(row_errors) > 20:
-            errors.append(f"... and {len(row_errors) - 20} more errors")
+    # Only the reported rows need their messages built
+    if len(bad_positions):
+        methods = validated_df['calculation_method'] if 'calculation_method' in validated_df.columns else None
+        for pos in bad_positions[:20]:  # Limit to first 20 errors
+            row_error_list = _decode_error_codes(
+                codes[pos], methods.iat[pos] if methods is not None else None
+            )
+            if pos in conflicts:
+                row_error_list.append(conflicts[pos])
+            row_num = validated_df.index[pos] + 2  # +1 for 0-index, +1 for header row
+            errors.append(f"Row {row_num}: {'; '.join(row_error_list)}")
+        if len(bad_positions) > 20:
+            errors.append(f"... and {len(bad_positions) - 20} more errors")
     
     # Check for duplicates within the file
     if 'product_id' in df.columns and 'entity_id' in df.columns:
@@ -330,13 +329,242 @@ def validate_bulk_data(df: pd.DataFrame) -> Tuple[bool, pd.DataFrame, List[str]]
             errors.append(f"Found {len(duplicates)} duplicate rows within the file")
     
     # Drop invalid rows if requested
-    if rows_to_drop:
-        validated_df = validated_df.drop(rows_to_drop)
-        errors.append(f"Removed {len(rows_to_drop)} invalid rows")
+    if len(bad_positions):
+        validated_df = validated_df.drop(validated_df.index[bad_positions])
+        errors.append(f"Removed {len(bad_positions)} invalid rows")
     
     return len(errors) == 0, validated_df, errors
 
 
+# (key, message) per check in _row_error_codes; the bit for a check is its position here
+_ROW_ERRORS = [
+    ('missing_product', "Missing required field: product_id"),
+    ('missing_entity', "Missing required field: entity_id"),
+    ('missing_qty', "Missing required field: safety_stock_qty"),
+    ('missing_from', "Missing required field: effective_from"),
+    ('product_nan', "product_id must be a number"),
+    ('entity_nan', "entity_id must be a number"),
+    ('qty_nan', "Safety stock quantity must be a number"),
+    ('qty_negative', "Safety stock quantity cannot be negative"),
+    ('qty_large', "Safety stock quantity is unreasonably large (max: 999,999)"),
+    ('rop_negative', "Reorder point cannot be negative"),
+    ('from_format', "Invalid effective_from date format (use YYYY-MM-DD)"),
+    ('from_early', "Effective from date cannot be before 2020-01-01"),
+    ('to_format', "Invalid effective_to date format (use YYYY-MM-DD)"),
+    ('to_before_from', "Effective to date must be after effective from date"),
+    ('priority_low', "Priority level must be at least 1"),
+    ('priority_high', "Priority level cannot exceed 9999"),
+    ('priority_customer', "Customer-specific rules should have priority level 500 or lower"),
+    ('method_invalid', "Invalid calculation method: {method}"),
+    ('safety_days_low', "Safety days must be positive for DAYS_OF_SUPPLY method"),
+    ('safety_days_high', "Safety days seems too high (>365 days)"),
+    ('lead_time_low', "Lead time must be positive"),
+    ('lead_time_low_ltb', "Lead time must be positive for LEAD_TIME_BASED method"),
+    ('lead_time_high', "Lead time seems too long (>365 days)"),
+    ('service_level_range', "Service level must be between 50% and 99.9%"),
+    ('std_negative', "Demand standard deviation cannot be negative"),
+    ('std_high', "Demand standard deviation seems unreasonably high"),
+    ('demand_negative', "Average daily demand cannot be negative"),
+    ('demand_high', "Average daily demand seems unreasonably high"),
+]
+
+
+def _numeric_column(df: pd.DataFrame, col: str) -> np.ndarray:
+    """Helper to get a column as float64 (NaN where missing or non-numeric)"""
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _date_column(df: pd.DataFrame, col: str) -> np.ndarray:
+    """Helper to get a column as datetime64[D] (NaT where missing or unparseable)"""
+    if col not in df.columns:
+        return np.full(len(df), np.datetime64('NaT'), dtype='datetime64[D]')
+    return pd.to_datetime(df[col], errors='coerce').to_numpy(dtype='datetime64[D]')
+
+
+def _present(df: pd.DataFrame, col: str) -> np.ndarray:
+    """Helper to get a bool mask of cells that hold a value"""
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return df[col].notna().to_numpy(dtype=bool)
+
+
+def _row_error_codes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Run the field checks of validate_safety_stock_data and
+    validate_calculation_parameters over whole columns at once
+    
+    Args:
+        df: Upload DataFrame
+    
+    Returns:
+        int32 array of error bit flags per row (0 = no error), see _ROW_ERRORS
+    """
+    product = _numeric_column(df, 'product_id')
+    entity = _numeric_column(df, 'entity_id')
+    ss_qty = _numeric_column(df, 'safety_stock_qty')
+    rop = _numeric_column(df, 'reorder_point')
+    priority = _numeric_column(df, 'priority_level')
+    customer = _numeric_column(df, 'customer_id')
+    safety_days = _numeric_column(df, 'safety_days')
+    lead_time = _numeric_column(df, 'lead_time_days')
+    service_level = _numeric_column(df, 'service_level_percent')
+    std_dev = _numeric_column(df, 'demand_std_deviation')
+    avg_demand = _numeric_column(df, 'avg_daily_demand')
+    eff_from = _date_column(df, 'effective_from')
+    eff_to = _date_column(df, 'effective_to')
+    
+    has_product = _present(df, 'product_id')
+    has_entity = _present(df, 'entity_id')
+    has_qty = _present(df, 'safety_stock_qty')
+    has_from = _present(df, 'effective_from')
+    has_method = _present(df, 'calculation_method')
+    
+    if 'calculation_method' in df.columns:
+        method = df['calculation_method'].to_numpy(dtype=object)
+    else:
+        method = np.full(len(df), None, dtype=object)
+    dos = method == 'DAYS_OF_SUPPLY'
+    ltb = method == 'LEAD_TIME_BASED'
+    calculated = dos | ltb
+    
+    # Comparisons against NaN/NaT are False, so missing values raise no flag
+    masks = {
+        'missing_product': ~has_product,
+        'missing_entity': ~has_entity,
+        'missing_qty': ~has_qty,
+        'missing_from': ~has_from,
+        'product_nan': has_product & np.isnan(product),
+        'entity_nan': has_entity & np.isnan(entity),
+        'qty_nan': has_qty & np.isnan(ss_qty),
+        'qty_negative': ss_qty < 0,
+        'qty_large': ss_qty > 999999,
+        'rop_negative': rop < 0,
+        'from_format': has_from & np.isnat(eff_from),
+        'from_early': eff_from < np.datetime64('2020-01-01'),
+        'to_format': _present(df, 'effective_to') & np.isnat(eff_to),
+        'to_before_from': eff_to <= eff_from,
+        'priority_low': priority < 1,
+        'priority_high': priority > 9999,
+        'priority_customer': (customer != 0) & ~np.isnan(customer) & (priority > 500),
+        'method_invalid': has_method & ~calculated & (method != 'FIXED'),
+        'safety_days_low': dos & (safety_days <= 0),
+        'safety_days_high': dos & (safety_days > 365),
+        'lead_time_low': dos & (lead_time <= 0),
+        'lead_time_low_ltb': ltb & (lead_time <= 0),
+        'lead_time_high': calculated & (lead_time > 365),
+        'service_level_range': ltb & ((service_level < 50) | (service_level > 99.9)),
+        'std_negative': ltb & (std_dev < 0),
+        'std_high': ltb & (std_dev > 99999),
+        'demand_negative': calculated & (avg_demand < 0),
+        'demand_high': dos & (avg_demand > 999999),
+    }
+    
+    codes = np.zeros(len(df), dtype=np.int32)
+    for bit, (key, _) in enumerate(_ROW_ERRORS):
+        codes |= masks[key].astype(np.int32) << bit
+    
+    return codes
+
+
+def _decode_error_codes(code: int, method=None) -> List[str]:
+    """Helper to turn error bit flags back into messages"""
+    return [
+        message.format(method=method)
+        for bit, (_, message) in enumerate(_ROW_ERRORS)
+        if code & (1 << bit)
+    ]
+
+
+def _find_existing_conflicts(df: pd.DataFrame, check: np.ndarray) -> Dict[int, str]:
+    """
+    Batch version of check_for_duplicates for upload rows
+    
+    Fetches the active rules for every product/entity in the upload with one
+    query and matches them to the rows in pandas.
+    
+    Args:
+        df: Upload DataFrame
+        check: Bool mask of rows to check (rows with valid ids and dates)
+    
+    Returns:
+        Dict of row position -> error message, for rows that conflict
+    """
+    positions = np.flatnonzero(check)
+    if not len(positions):
+        return {}
+    
+    rows = pd.DataFrame({
+        'pos': positions,
+        'product_id': _numeric_column(df, 'product_id')[positions],
+        'entity_id': _numeric_column(df, 'entity_id')[positions],
+        'customer_id': _numeric_column(df, 'customer_id')[positions],
+        'row_from': _date_column(df, 'effective_from')[positions],
+        'row_to': _date_column(df, 'effective_to')[positions],
+    })
+    
+    try:
+        engine = get_db_engine()
+        
+        query = text("""
+        SELECT id, product_id, entity_id, customer_id, effective_from, effective_to
+        FROM safety_stock_levels
+        WHERE product_id IN :product_ids
+        AND entity_id IN :entity_ids
+        AND delete_flag = 0
+        AND is_active = 1
+        """).bindparams(
+            bindparam('product_ids', expanding=True),
+            bindparam('entity_ids', expanding=True)
+        )
+        
+        with engine.connect() as conn:
+            existing = read_frame(conn, query, {
+                'product_ids': [int(v) for v in np.unique(rows['product_id'])],
+                'entity_ids': [int(v) for v in np.unique(rows['entity_id'])]
+            })
+    
+    except Exception as e:
+        logger.error(f"Error checking duplicates: {e}")
+        # Don't block on validation error, just log it
+        return {}
+    
+    if existing.empty:
+        return {}
+    
+    # Same key types on both sides; merge matches NaN customer_id (general rules) to NaN
+    for col in ('product_id', 'entity_id', 'customer_id'):
+        existing[col] = pd.to_numeric(existing[col]).astype(np.float64)
+    existing['ex_from'] = pd.to_datetime(existing['effective_from']).to_numpy(dtype='datetime64[D]')
+    existing['ex_to'] = pd.to_datetime(existing['effective_to']).to_numpy(dtype='datetime64[D]')
+    
+    pairs = rows.merge(existing, on=['product_id', 'entity_id', 'customer_id'])
+    if pairs.empty:
+        return {}
+    
+    ex_ongoing = pairs['ex_to'].isna()
+    reaches_start = ex_ongoing | (pairs['ex_to'] >= pairs['row_from'])
+    exact = pairs['ex_from'] == pairs['row_from']
+    overlap = reaches_start & (pairs['row_to'].isna() | (pairs['ex_from'] <= pairs['row_to']))
+    
+    conflicts = {
+        pos: "A safety stock rule already exists for this product/entity/customer/date combination"
+        for pos in pairs.loc[exact, 'pos'].unique()
+    }
+    
+    # Overlaps are only reported for rows without an exact duplicate
+    overlapping = pairs[overlap & ~pairs['pos'].isin(list(conflicts))]
+    for pos, group in overlapping.groupby('pos', sort=False):
+        overlap_info = [
+            f"ID {row.id} ({row.effective_from} to {row.effective_to if pd.notna(row.effective_to) else 'ongoing'})"
+            for row in group.head(3).itertuples()
+        ]
+        conflicts[pos] = f"Date range overlaps with existing rules: {'; '.join(overlap_info)}"
+    
+    return conflicts
+
+
 def get_validation_summary(errors: List[str]) -> str:
     """
     Format validation errors for display